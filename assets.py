@@ -0,0 +1,23 @@
+import os
+
+from settings import CACHE_DIR
+
+# Widest rendering of the profile photo: the sidebar on a high-density screen
+PHOTO_WIDTH = 600
+
+
+def profile_photo(path, width=PHOTO_WIDTH, cache_dir=CACHE_DIR):
+    # WebP copy of an image resized to `width`, written once to the cache directory (PIL is only
+    # imported to write it) and rewritten when the original changes; returns its bytes
+    name = os.path.splitext(os.path.basename(path))[0]
+    cached = os.path.join(cache_dir, 'assets', f'{name}-{width}.webp')
+    if not os.path.exists(cached) or os.path.getmtime(cached) < os.path.getmtime(path):
+        from PIL import Image
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        tmp_path = f'{cached}.{os.getpid()}.tmp'
+        with Image.open(path) as image:
+            image.thumbnail((width, max(1, width * image.height // image.width)))
+            image.save(tmp_path, 'WEBP', quality=85, method=6)
+        os.replace(tmp_path, cached)
+    with open(cached, 'rb') as handle:
+        return handle.read()
@@ -0,0 +1,247 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+from benchmarks.synthetic import departements_geojson, generate, parse_rows
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+# Load test of one portfolio.py server process: N browser sessions are simulated by headless
+# websocket clients speaking Streamlit's protocol (the protobuf messages the frontend exchanges with
+# the server), all connected at once. Each session switches tabs, turns preview pages and changes
+# the year and department selectors, as a viewer would; every interaction is timed from the message
+# sent to the end of the rerun it triggers (the whole script, or only the fragment holding the
+# widget, as in a browser). The caches (st.cache_data, st.cache_resource, the dataset release) are
+# shared by the sessions of the process, so they are warmed by one session before measuring.
+
+# Numbers of concurrent sessions to measure, one after the other
+DEFAULT_SESSIONS = [1, 5, 10, 25]
+
+TAB_ABOUT = 'About Me'
+TAB_ANALYSIS = 'Regional and Demographic Distribution of Patient Pathologies in France'
+
+SERVER_START_TIMEOUT_SECONDS = 60
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(source, cache_dir, port, geojson=None):
+    # `streamlit run portfolio.py` as in production, on its own port and cache directory
+    env = dict(os.environ, PORTFOLIO_DATA_URL=source, PORTFOLIO_CACHE_DIR=cache_dir)
+    if geojson:
+        env['PORTFOLIO_GEOJSON_PATH'] = geojson
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', 'portfolio.py', '--server.headless', 'true',
+         '--server.port', str(port), '--server.fileWatcherType', 'none', '--browser.gatherUsageStats', 'false'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/_stcore/health', timeout=1):
+                return server
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError(f"streamlit exited with code {server.returncode}")
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"streamlit did not answer within {SERVER_START_TIMEOUT_SECONDS} s")
+
+
+def rss_mb(pid):
+    # Current resident set size of the server process
+    with open(f'/proc/{pid}/statm') as handle:
+        return int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+class Session:
+    # One browser tab: a websocket connection, the widgets the app has drawn so far and the values
+    # the frontend would send back with every rerun
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.widgets = {}
+        self.states = {}
+        self.timings = []
+        self.exceptions = []
+
+    def _record(self, delta):
+        kind = delta.WhichOneof('type')
+        if kind == 'new_element':
+            element = getattr(delta.new_element, delta.new_element.WhichOneof('type'))
+            if delta.new_element.WhichOneof('type') == 'exception':
+                self.exceptions.append(element.message)
+            elif getattr(element, 'id', '') and hasattr(element, 'label'):
+                self.widgets[element.id] = (element.label, element, delta.fragment_id)
+        elif kind == 'add_block' and delta.add_block.WhichOneof('type') == 'tab_container':
+            self.widgets[delta.add_block.tab_container.id] = ('tabs', delta.add_block.tab_container, delta.fragment_id)
+
+    def widget(self, label, index=0):
+        # The index-th widget labelled `label`, in the order the app drew them
+        return [widget for widget in self.widgets.values() if widget[0] == label][index]
+
+    async def rerun(self, action, fragment_id=''):
+        message = BackMsg()
+        message.rerun_script.widget_states.widgets.extend(self.states.values())
+        if fragment_id:
+            message.rerun_script.fragment_id = fragment_id
+        start = time.perf_counter()
+        await self.websocket.send(message.SerializeToString())
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await self.websocket.recv())
+            kind = forward.WhichOneof('type')
+            if kind == 'delta':
+                self._record(forward.delta)
+            elif kind == 'script_finished' and forward.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                break
+        self.timings.append((action, time.perf_counter() - start))
+
+    async def set(self, action, label, index=0, **value):
+        # Change a widget as a viewer would; `value` is its WidgetState field, e.g. string_value='2021'
+        _, element, fragment_id = self.widget(label, index)
+        self.states[element.id] = WidgetState(id=element.id, **value)
+        await self.rerun(action, fragment_id)
+
+
+async def scenario(session, rounds, rng, think):
+    # What a viewer of the analysis tab does, `rounds` times over
+    await session.rerun('open')
+    for _ in range(rounds):
+        interactions = [
+            ('analysis tab', 'tabs', 0, lambda widget: dict(string_value=TAB_ANALYSIS)),
+            ('page', 'Page number:', 0, lambda widget: dict(int_value=rng.randint(1, int(widget.max)))),
+            ('page', 'Page number:', 0, lambda widget: dict(int_value=rng.randint(1, int(widget.max)))),
+            ('chart year', 'Choose a year', 0, lambda widget: dict(string_value=rng.choice(widget.options))),
+            ('map year', 'Choose a year', 1, lambda widget: dict(string_value=rng.choice(widget.options))),
+            ('department', 'Choose a department', 0, lambda widget: dict(string_value=rng.choice(widget.options))),
+            ('about tab', 'tabs', 0, lambda widget: dict(string_value=TAB_ABOUT)),
+        ]
+        for action, label, index, value in interactions:
+            await asyncio.sleep(rng.uniform(0, 2 * think))
+            await session.set(action, label, index, **value(session.widget(label, index)[1]))
+
+
+async def connect(port):
+    websocket = await websockets.connect(
+        f'ws://127.0.0.1:{port}/_stcore/stream', subprotocols=['streamlit'], max_size=None,
+    )
+    return Session(websocket)
+
+
+async def run_sessions(port, pid, count, rounds, think, seed):
+    # `count` sessions connected at once, each playing the scenario; the memory is measured with
+    # all of them still connected, so it includes the state the server keeps per session
+    before = rss_mb(pid)
+    sessions = [await connect(port) for _ in range(count)]
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        scenario(session, rounds, random.Random(seed + number), think) for number, session in enumerate(sessions)
+    ))
+    seconds = time.perf_counter() - start
+    after = rss_mb(pid)
+    for session in sessions:
+        await session.websocket.close()
+    exceptions = [message for session in sessions for message in session.exceptions]
+    if exceptions:
+        raise RuntimeError(f"portfolio.py failed: {exceptions[:3]}")
+    latencies = [seconds for session in sessions for _, seconds in session.timings]
+    actions = {}
+    for session in sessions:
+        for action, timing in session.timings:
+            actions.setdefault(action, []).append(timing)
+    return {
+        'sessions': count,
+        'reruns': len(latencies),
+        'seconds': seconds,
+        'p50': percentile(latencies, 50),
+        'p99': percentile(latencies, 99),
+        'reruns_per_second': len(latencies) / seconds,
+        'rss_mb': after,
+        'mb_per_session': (after - before) / count,
+        'actions': {action: {'p50': percentile(timings, 50), 'p99': percentile(timings, 99)} for action, timings in actions.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test one portfolio.py server with concurrent simulated sessions")
+    parser.add_argument('--sessions', type=int, nargs='+', default=DEFAULT_SESSIONS, help="concurrent sessions, e.g. 1 5 10 25")
+    parser.add_argument('--rounds', type=int, default=3, help="times each session plays the scenario")
+    parser.add_argument('--think', type=float, default=0.0, help="mean seconds a viewer waits between interactions")
+    parser.add_argument('--rows', default='10k', help="size of the synthetic dataset served")
+    parser.add_argument('--source', help="dataset to serve instead of the synthetic one")
+    parser.add_argument('--data-dir', default=os.path.join(HERE, 'data'))
+    parser.add_argument('--output', default=os.path.join(HERE, 'results'))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    source, geojson = args.source, None
+    if source is None:
+        rows = parse_rows(args.rows)
+        source = os.path.join(args.data_dir, f'synthetic-{rows}.csv')
+        if not os.path.exists(source):
+            print(f"generating {source}")
+            generate(source, rows)
+        # The synthetic departments come with their own polygons, so the map needs no download
+        geojson = os.path.join(args.data_dir, 'departements-synthetic.geojson')
+        with open(geojson, 'w', encoding='utf-8') as handle:
+            json.dump(departements_geojson(), handle)
+
+    results = {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'source': source,
+        'rounds': args.rounds,
+        'think': args.think,
+    }
+    with tempfile.TemporaryDirectory() as cache_dir:
+        port = free_port()
+        server = start_server(source, cache_dir, port, geojson)
+        try:
+            # One session first loads the dataset and fills the shared caches
+            warmup = asyncio.run(run_sessions(port, server.pid, 1, 1, 0, args.seed))
+            results['warmup_seconds'] = warmup['seconds']
+            results['runs'] = []
+            for count in args.sessions:
+                run = asyncio.run(run_sessions(port, server.pid, count, args.rounds, args.think, args.seed))
+                results['runs'].append(run)
+                print(f"{count} sessions: {run['reruns']} reruns in {run['seconds']:.1f} s, "
+                      f"p50 {run['p50'] * 1000:.0f} ms, p99 {run['p99'] * 1000:.0f} ms, "
+                      f"{run['reruns_per_second']:.1f} reruns/s, RSS {run['rss_mb']:.0f} MB "
+                      f"({run['mb_per_session']:+.1f} MB per session)")
+        finally:
+            server.terminate()
+            server.wait()
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"load-{results['timestamp'].replace(':', '')}.json")
+    with open(path, 'w', encoding='utf-8') as handle:
+        json.dump(results, handle, indent=2)
+    print(f"results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+import argparse
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.synthetic import generate, parse_rows
+from refresh import Refresher
+
+# Check of the background revalidation (refresh.py) against a local stand-in for the ameli server:
+# a ThreadingHTTPServer serving one export with an ETag, answering 304 to a conditional request
+# that carries it and 200 with the new body once the export changes. The refresher must download
+# the export once, keep it on a 304, swap in a new release when the export changes, and its
+# background thread must survive an export it cannot build and pick up the next good one. The
+# unusable export must never reach the local copy: the preview keeps paging the last good one, a
+# restarted process serves it, and it stays intact when the server goes back to its ETag (a 304).
+
+# Seconds between two revalidations of the background thread
+INTERVAL_SECONDS = 0.2
+
+# Seconds the background thread gets to reach each expected state
+WAIT_SECONDS = 60
+
+
+class Export:
+    # The body the stand-in server currently serves, and the answers it gave
+
+    def __init__(self, body):
+        self.lock = threading.Lock()
+        self.statuses = []
+        self.serve(body)
+
+    def serve(self, body):
+        with self.lock:
+            self.body = body
+            self.etag = f'"{hashlib.sha1(body).hexdigest()}"'
+
+
+def handler(export):
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            with export.lock:
+                body, etag = export.body, export.etag
+                status = 304 if self.headers.get('If-None-Match') == etag else 200
+                export.statuses.append(status)
+            self.send_response(status)
+            self.send_header('ETag', etag)
+            if status == 304:
+                self.end_headers()
+                return
+            self.send_header('Content-Type', 'text/csv')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def wait_for(condition, what):
+    deadline = time.monotonic() + WAIT_SECONDS
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError(f"timed out waiting for {what}")
+        time.sleep(INTERVAL_SECONDS / 4)
+
+
+def check_served(refresher, release):
+    # `release` is served and answers the chart queries, and the preview pages its rows, not those
+    # of a download that was not built
+    assert refresher.current() is release
+    assert len(release.cube.query(['annee'])), "the served release answers no query"
+    assert refresher.pager().count() == release.cube.rows, "the preview does not page the served release"
+    assert 'annee' in refresher.pager().page(0, 1).columns
+
+
+def check(first, second, mode, engine='pandas'):
+    # Play the scenario against a fresh cache directory; `first` and `second` are two different exports
+    export = Export(first)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler(export))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/effectifs.csv'
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            refresher = Refresher(url, cache_dir=cache_dir, interval=INTERVAL_SECONDS, mode=mode, engine=engine)
+            release = refresher.current()
+            assert export.statuses == [200], export.statuses
+            assert not refresher.refresh(), "an unchanged export was rebuilt"
+            assert export.statuses[-1] == 304, export.statuses
+            assert refresher.current() is release
+
+            export.serve(second)
+            assert refresher.refresh(), "a changed export was not picked up"
+            changed = refresher.current()
+            assert changed.version != release.version
+            assert changed.cube.rows != release.cube.rows
+
+            # An answer the refresher cannot build a release from: the thread logs it, keeps serving
+            # the last good release and revalidates again
+            refresher.start()
+            requests_before = len(export.statuses)
+            export.serve(b'not;an;export\n1;2;3\n')
+            wait_for(lambda: len(export.statuses) >= requests_before + 2, "a revalidation after the failure")
+            assert refresher._thread.is_alive(), "the refresh thread died"
+            check_served(refresher, changed)
+            restarted = Refresher(url, cache_dir=cache_dir, interval=0, mode=mode, engine=engine)
+            assert restarted.current().cube.rows == changed.cube.rows, "a restart does not serve the last good copy"
+
+            # Back to the export of the release being served: a 304, and the local copy is still good
+            requests_before = len(export.statuses)
+            export.serve(second)
+            wait_for(lambda: len(export.statuses) >= requests_before + 2, "a revalidation of the restored export")
+            assert export.statuses[-1] == 304, export.statuses
+            check_served(refresher, changed)
+
+            export.serve(first)
+            wait_for(lambda: refresher.current() is not changed, "the release after the failure")
+            assert refresher.current().cube.rows == release.cube.rows
+            refresher.stop()
+    finally:
+        server.shutdown()
+        server.server_close()
+    return export.statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the background revalidation against a local HTTP server")
+    parser.add_argument('--rows', default='10k', help="size of the first synthetic export served (the second is twice as large)")
+    parser.add_argument('--modes', nargs='+', default=['snapshot', 'stream'], help="ingest modes to check")
+    parser.add_argument('--duckdb', action='store_true', help="also check the DuckDB engine")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        bodies = []
+        for seed in (0, 1):
+            path = os.path.join(data_dir, f'synthetic-{seed}.csv')
+            generate(path, parse_rows(args.rows) * (seed + 1), seed=seed)
+            with open(path, 'rb') as handle:
+                bodies.append(handle.read())
+    runs = [(mode, 'pandas') for mode in args.modes] + ([('snapshot', 'duckdb')] if args.duckdb else [])
+    for mode, engine in runs:
+        statuses = check(*bodies, mode, engine)
+        print(f"{mode} ({engine}): ok, {len(statuses)} requests ({statuses.count(200)} x 200, {statuses.count(304)} x 304)")
+
+
+if __name__ == '__main__':
+    main()
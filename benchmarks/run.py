@@ -0,0 +1,297 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import shutil
+import time
+from datetime import datetime, timezone
+
+import altair as alt
+import numpy as np
+import pandas as pd
+from streamlit_folium import _get_feature_group_string
+
+from benchmarks.synthetic import departements_geojson, generate, parse_rows
+from charts import CASE_TOTALS, CASES, spec_bytes, to_spec, within_budget
+from cube import AGE_TOTAL, DIMENSIONS, LABELS, MEASURES, SEX_TOTAL, Cube
+from ingest import iter_chunks, read_csv, read_snapshot, where_mask, write_snapshot
+from maps import base_map, cases_colormap, dept_values, year_data, year_layer
+from pager import CsvPager
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Default dataset sizes: the bundled sample's order of magnitude, then one and ten million rows
+DEFAULT_SIZES = ['10k', '1M', '10M']
+
+# A stage slower than the baseline by more than this factor is reported as a regression,
+# unless both timings are below the noise floor
+REGRESSION_THRESHOLD = 1.25
+NOISE_FLOOR_SECONDS = 0.005
+
+CANCERS = {'patho_niv1': 'Cancers'}
+
+# The aggregations behind the charts of tab2: (name, chart mark, Cube.query arguments)
+CHART_QUERIES = [
+    ('patho_by_sexe', 'bar', dict(by=['patho_niv1', 'libelle_sexe'], where={'libelle_sexe': ['hommes', 'femmes']})),
+    ('patho_by_age', 'bar', dict(by=['patho_niv1', 'libelle_classe_age'], age='detail', sex='detail')),
+    ('patho_by_year', 'line', dict(by=['annee', 'patho_niv1'], age='detail', sex='detail')),
+    ('patho_cancers_by_year', 'line', dict(by=['annee'], where=CANCERS, **CASE_TOTALS)),
+    ('patho_cancers_niv2_by_year', 'line', dict(by=['annee', 'patho_niv2'], where=CANCERS, **CASE_TOTALS)),
+    ('patho_cancers_niv3_by_year', 'line', dict(by=['annee', 'patho_niv3'], where=CANCERS, **CASE_TOTALS)),
+    ('patho_cancers_niv2_year', 'bar', dict(by=['patho_niv2'], where={**CANCERS, 'annee': 2015}, **CASE_TOTALS)),
+    ('patho_age_sex_year', 'bar', dict(by=['libelle_classe_age', 'libelle_sexe'], where={**CANCERS, 'annee': 2015},
+                                       age='detail', sex='detail', **CASES)),
+    ('cases_by_year_dept', 'line', dict(by=['annee'], where={**CANCERS, 'dept': '59'}, **CASE_TOTALS)),
+    ('cases_by_type_dept', 'bar', dict(by=['patho_niv2'], where={**CANCERS, 'dept': '59'}, **CASE_TOTALS)),
+    ('cases_by_age_sex_dept', 'bar', dict(by=['libelle_classe_age', 'libelle_sexe'], where={**CANCERS, 'dept': '59'},
+                                          age='detail', sex='detail', **CASES)),
+]
+
+# Groupings whose prevalence is checked against a computation from the raw rows: (name, Cube.query arguments)
+PREVALENCE_QUERIES = [
+    ('prev_by_year_dept', dict(by=['annee', 'dept'], where=CANCERS)),
+    ('prev_by_patho', dict(by=['patho_niv1'])),
+    ('prev_by_age_sex', dict(by=['libelle_classe_age', 'libelle_sexe'], where=CANCERS, age='detail', sex='detail')),
+]
+
+# The export rounds its row prevalences to 3 decimals, so their weighted mean is this close to the exact one
+EXPORT_PREV_TOLERANCE = 1e-3
+
+
+def rss_mb():
+    # Current resident set size of this process
+    with open('/proc/self/statm') as handle:
+        return int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Recorder:
+    # Times named stages and keeps the best of `repeat` runs with the memory seen after them
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.stages = []
+
+    def stage(self, name, func, size=None):
+        timings = []
+        for _ in range(self.repeat):
+            gc.collect()
+            start = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - start)
+        record = {
+            'name': name,
+            'seconds': min(timings),
+            'rss_mb': round(rss_mb(), 1),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        }
+        if size is not None:
+            record['bytes'] = size(result)
+        self.stages.append(record)
+        print(f"  {name:<40} {record['seconds'] * 1000:10.1f} ms  peak {record['peak_rss_mb']:8.1f} MB")
+        return result
+
+
+def chart_spec(frame, mark):
+    # Vega-Lite spec of a chart shaped like the ones of tab2, as portfolio.py builds it
+    measure = next(c for c in frame.columns if c in MEASURES)
+    columns = [c for c in frame.columns if c != measure]
+    if len(columns) > 1:
+        frame = within_budget(frame, columns[1] if columns[0] == 'annee' else columns[0])
+    chart = alt.Chart(frame)
+    chart = chart.mark_line(point=True) if mark == 'line' else chart.mark_bar()
+    encoding = {'x': alt.X(f'{columns[0]}:N'), 'y': alt.Y(f'{measure}:Q'), 'tooltip': list(frame.columns)}
+    if len(columns) > 1:
+        encoding['color'] = f'{columns[1]}:N'
+    return to_spec(chart.encode(**encoding).properties(width=800))
+
+
+def sorted_groups(frame, by):
+    # Groups sorted by key, as the pandas order follows its categories
+    by = [by] if isinstance(by, str) else list(by)
+    strings = {c: 'string' for c in frame.columns if isinstance(frame[c].dtype, pd.CategoricalDtype)}
+    return frame.astype(strings).sort_values(by, ignore_index=True)
+
+
+def check_same(name, expected, actual, by):
+    # Fail unless both engines return the same groups with the same sums; the float32 prevalences
+    # may differ in their last bits
+    frames = [sorted_groups(frame, by) for frame in (expected, actual)]
+    exact = [c for c in frames[0].columns if c != 'prev']
+    try:
+        pd.testing.assert_frame_equal(frames[0][exact], frames[1][exact], check_exact=True)
+        if 'prev' in frames[0].columns:
+            pd.testing.assert_series_equal(frames[0]['prev'], frames[1]['prev'], rtol=1e-6)
+    except AssertionError as error:
+        raise AssertionError(f"{name}: the DuckDB engine differs from pandas\n{error}") from None
+
+
+def reference_prevalence(data, by, where=None, age=None, sex=None):
+    # Prevalence of every group straight from the raw rows, in float64: 100 * cases / population of
+    # the rows whose case count is known, and the population-weighted mean of the export's own prevalences
+    rows = data[where_mask(data, where or {})]
+    for column, total, mode in (('cla_age_5', AGE_TOTAL, age), ('sexe', SEX_TOTAL, sex)):
+        if mode == 'detail':
+            rows = rows[rows[column] != total]
+    known = rows['Ntop'].notna().to_numpy()
+    npop = rows['Npop'].to_numpy(dtype='float64', na_value=np.nan)
+    prev = rows['prev'].to_numpy(dtype='float64', na_value=np.nan)
+    sums = pd.DataFrame({
+        'Ntop': rows['Ntop'].to_numpy(dtype='float64', na_value=np.nan),
+        'Npop': np.where(known, npop, np.nan),
+        'weighted': prev * npop,
+        'weights': np.where(np.isnan(prev), np.nan, npop),
+    }).groupby([rows[column].to_numpy() for column in by]).sum()
+    return pd.DataFrame({
+        **{column: sums.index.get_level_values(i) for i, column in enumerate(by)},
+        'prev': (100 * sums['Ntop'] / sums['Npop']).to_numpy(),
+        'export_prev': (sums['weighted'] / sums['weights']).to_numpy(),
+    })
+
+
+def check_prevalence(name, expected, actual, by):
+    # Fail unless the prevalence of every group is the reference one (up to the float32 precision of
+    # the prev column) and agrees with the export's row prevalences
+    expected, actual = sorted_groups(expected, by), sorted_groups(actual, by)
+    try:
+        pd.testing.assert_frame_equal(expected[by], actual[by], check_dtype=False)
+        np.testing.assert_allclose(actual['prev'], expected['prev'], rtol=1e-6)
+        np.testing.assert_allclose(actual['prev'], expected['export_prev'], rtol=0, atol=EXPORT_PREV_TOLERANCE)
+    except AssertionError as error:
+        raise AssertionError(f"{name}: the prevalence differs from the raw rows\n{error}") from None
+
+
+def run_size(rows, data_dir, repeat, duckdb=False):
+    path = os.path.join(data_dir, f'synthetic-{rows}.csv')
+    if not os.path.exists(path):
+        print(f"generating {path}")
+        generate(path, rows)
+    recorder = Recorder(repeat)
+    print(f"{rows} rows")
+
+    data = recorder.stage('parse_csv', lambda: read_csv(path))
+    snapshot = os.path.join(data_dir, f'synthetic-{rows}.parquet')
+    recorder.stage('write_snapshot', lambda: write_snapshot(data, snapshot))
+    recorder.stage('read_snapshot', lambda: read_snapshot(snapshot))
+    recorder.stage('filter_cancers', lambda: data[data['patho_niv1'] == 'Cancers'])
+    recorder.stage('filter_detail_rows', lambda: data[(data['cla_age_5'] != 'tsage') & (data['sexe'] != 9)])
+    columns = DIMENSIONS + list(LABELS) + MEASURES
+    recorder.stage('stream_cube', lambda: Cube.from_chunks(iter_chunks(path, columns=columns)))
+    cube = recorder.stage('build_cube', lambda: Cube.from_frame(data))
+    # Cube maintenance when one year of the partitioned snapshot changes: that year's cube, then the merge
+    years = dict(list(data.groupby('annee', sort=False)))
+    parts = [Cube.from_frame(rows) for rows in years.values()]
+    recorder.stage('year_cube', lambda: Cube.from_frame(years[max(years)]))
+    recorder.stage('merge_year_cubes', lambda: Cube.merge(parts))
+
+    references = {name: reference_prevalence(data, **query) for name, query in PREVALENCE_QUERIES}
+    for name, query in PREVALENCE_QUERIES:
+        check_prevalence(name, references[name], recorder.stage(f'rates:{name}', lambda: cube.query(measures=['prev'], **query)), query['by'])
+
+    frames = {}
+    for name, mark, query in CHART_QUERIES:
+        frame = frames[name] = recorder.stage(f'chart:{name}', lambda: cube.query(**query))
+        recorder.stage(f'spec:{name}', lambda: chart_spec(frame, mark), size=spec_bytes)
+
+    if duckdb:
+        from duckcube import DuckCube, write_parquet
+        duck_snapshot = os.path.join(data_dir, f'synthetic-{rows}.duckdb.parquet')
+        recorder.stage('duckdb:write_parquet', lambda: write_parquet(path, duck_snapshot))
+        duck = recorder.stage('duckdb:open', lambda: DuckCube(duck_snapshot))
+        for name, mark, query in CHART_QUERIES:
+            check_same(name, frames[name], recorder.stage(f'duckdb:chart:{name}', lambda: duck.query(**query)), query['by'])
+        for name, query in PREVALENCE_QUERIES:
+            check_prevalence(name, references[name], recorder.stage(f'duckdb:rates:{name}', lambda: duck.query(measures=['prev'], **query)), query['by'])
+
+    # Data preview: index the CSV once, then read single pages, in file order or sorted server side
+    preview_dir = os.path.join(data_dir, f'preview-{rows}')
+
+    def index_csv():
+        shutil.rmtree(preview_dir, ignore_errors=True)
+        return CsvPager(path, preview_dir)
+
+    pager = recorder.stage('preview:index_csv', index_csv)
+    recorder.stage('preview:last_page', lambda: pager.page(len(pager) - 100, 100))
+    sort = dict(sort='Npop', descending=True, where={'libelle_sexe': 'femmes'})
+
+    def sort_filter():
+        # Drop the row numbers of the previous run, which the pager would map instead of computing them
+        orders = os.path.join(preview_dir, 'preview')
+        for name in os.listdir(orders):
+            if not name.endswith('-rows.npy'):
+                os.remove(os.path.join(orders, name))
+        return pager.order(**sort)
+
+    recorder.stage('preview:sort_filter', sort_filter)
+    recorder.stage('preview:sorted_page', lambda: pager.page(len(pager) // 4, 100, **sort))
+
+    values = recorder.stage('map:dept_values', lambda: dept_values(cube, CANCERS))
+    colormap = cases_colormap(values)
+    geojson = departements_geojson()
+    recorder.stage('map:base_html', lambda: base_map(geojson, colormap).get_root().render(), size=len)
+    year = values['annee'].iloc[0] if len(values) else None
+    year_values = values[values['annee'] == year]
+    colors, markers = recorder.stage('map:year_data', lambda: year_data(year_values, colormap))
+    # What st_folium sends when the year changes: the script of the year layer only
+    recorder.stage(
+        'map:year_layer',
+        lambda: _get_feature_group_string(year_layer(colors, markers, year), base_map(geojson, colormap)),
+        size=len,
+    )
+    return {'rows': len(data), 'requested_rows': rows, 'stages': recorder.stages}
+
+
+def compare(results, baseline_path):
+    # Print the ratio of every stage to the baseline run; return the regressed stages
+    with open(baseline_path, encoding='utf-8') as handle:
+        baseline = {run['requested_rows']: run for run in json.load(handle)['runs']}
+    regressions = []
+    for run in results['runs']:
+        previous = baseline.get(run['requested_rows'])
+        if previous is None:
+            continue
+        before = {stage['name']: stage for stage in previous['stages']}
+        for stage in run['stages']:
+            old = before.get(stage['name'])
+            if not old or max(old['seconds'], stage['seconds']) < NOISE_FLOOR_SECONDS:
+                continue
+            ratio = stage['seconds'] / old['seconds']
+            if ratio > REGRESSION_THRESHOLD:
+                regressions.append((run['requested_rows'], stage['name'], ratio))
+    for rows, name, ratio in regressions:
+        print(f"REGRESSION {rows} rows {name}: {ratio:.2f}x slower than baseline")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time every pipeline stage of portfolio.py on synthetic data")
+    parser.add_argument('--rows', nargs='+', default=DEFAULT_SIZES, help="dataset sizes, e.g. 10k 1M 10M")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per stage, the fastest is kept")
+    parser.add_argument('--data-dir', default=os.path.join(HERE, 'data'))
+    parser.add_argument('--output', default=os.path.join(HERE, 'results'))
+    parser.add_argument('--compare', help="previous results file to check for regressions")
+    parser.add_argument('--duckdb', action='store_true', help="also time the DuckDB engine and check it returns the pandas results")
+    args = parser.parse_args()
+
+    results = {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'runs': [run_size(parse_rows(rows), args.data_dir, args.repeat, args.duckdb) for rows in args.rows],
+    }
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"bench-{results['timestamp'].replace(':', '')}.json")
+    with open(path, 'w', encoding='utf-8') as handle:
+        json.dump(results, handle, indent=2)
+    print(f"results written to {path}")
+    if args.compare and compare(results, args.compare):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+# Budget for the first paint of the "About Me" tab in a fresh process
+FIRST_PAINT_BUDGET_SECONDS = 1.0
+
+# Run in a fresh interpreter: Streamlit itself is imported first, as the server has it loaded before
+# any session connects, then the first script run of portfolio.py is timed. The first paint is the
+# first element sent to the browser; the rest of the page streams in until the run completes.
+CHILD = """
+import json, sys, time
+from streamlit.runtime.scriptrunner.script_runner import ScriptRunner
+from streamlit.testing.v1 import AppTest
+painted = []
+enqueue = ScriptRunner._enqueue_forward_msg
+def timed_enqueue(self, msg):
+    if not painted and msg.HasField('delta'):
+        painted.append(time.perf_counter())
+    enqueue(self, msg)
+ScriptRunner._enqueue_forward_msg = timed_enqueue
+app = AppTest.from_file(sys.argv[1], default_timeout=600)
+if sys.argv[2]:
+    app.session_state['tab'] = sys.argv[2]
+start = time.perf_counter()
+app.run()
+print(json.dumps({
+    'first_paint': painted[0] - start, 'seconds': time.perf_counter() - start,
+    'exceptions': [e.value for e in app.exception],
+}))
+"""
+
+TABS = {
+    'about': '',
+    'analysis': 'Regional and Demographic Distribution of Patient Pathologies in France',
+}
+
+
+def first_run(tab):
+    # Seconds to the first paint and to the end of the first script run of a new process showing `tab`
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD, os.path.join(ROOT, 'portfolio.py'), TABS[tab]],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    run = json.loads(result.stdout.strip().splitlines()[-1])
+    if run['exceptions']:
+        raise RuntimeError(f"portfolio.py failed: {run['exceptions']}")
+    return run['first_paint'], run['seconds']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the first script run of portfolio.py in fresh processes")
+    parser.add_argument('--tab', choices=sorted(TABS), default='about')
+    parser.add_argument('--repeat', type=int, default=5, help="fresh processes to start")
+    args = parser.parse_args()
+
+    first_paints, runs = zip(*(first_run(args.tab) for _ in range(args.repeat)))
+    for name, timings in (('first paint', first_paints), ('complete run', runs)):
+        print(f"{args.tab} tab {name}: median {statistics.median(timings) * 1000:.0f} ms, "
+              f"min {min(timings) * 1000:.0f} ms, max {max(timings) * 1000:.0f} ms over {len(timings)} processes")
+    if args.tab == 'about' and statistics.median(first_paints) > FIRST_PAINT_BUDGET_SECONDS:
+        print(f"first paint over the {FIRST_PAINT_BUDGET_SECONDS:g} s budget")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+import argparse
+import os
+from itertools import chain, zip_longest
+
+import numpy as np
+import pandas as pd
+
+from maps import DEPT_COORDINATES
+
+# Departments of each region, as found in the ameli export (dept '999' holds the region total,
+# region 99 / dept '999' the national total)
+REGIONS = {
+    1: ['971'], 2: ['972'], 3: ['973'], 4: ['974'], 6: ['976'],
+    11: ['75', '77', '78', '91', '92', '93', '94', '95'],
+    24: ['18', '28', '36', '37', '41', '45'],
+    27: ['21', '25', '39', '58', '70', '71', '89', '90'],
+    28: ['14', '27', '50', '61', '76'],
+    32: ['02', '59', '60', '62', '80'],
+    44: ['08', '10', '51', '52', '54', '55', '57', '67', '68', '88'],
+    52: ['44', '49', '53', '72', '85'],
+    53: ['22', '29', '35', '56'],
+    75: ['16', '17', '19', '23', '24', '33', '40', '47', '64', '79', '86', '87'],
+    76: ['09', '11', '12', '30', '31', '32', '34', '46', '48', '65', '66', '81', '82'],
+    84: ['01', '03', '07', '15', '26', '38', '42', '43', '63', '69', '73', '74'],
+    93: ['04', '05', '06', '13', '83', '84'],
+    94: ['2A', '2B'],
+}
+NATIONAL_REGION = 99
+TOTAL_DEPT = '999'
+
+AGE_CLASSES = [
+    ('00-04', 'de 0 à 4 ans'), ('05-09', 'de 5 à 9 ans'), ('10-14', 'de 10 à 14 ans'),
+    ('15-19', 'de 15 à 19 ans'), ('20-24', 'de 20 à 24 ans'), ('25-29', 'de 25 à 29 ans'),
+    ('30-34', 'de 30 à 34 ans'), ('35-39', 'de 35 à 39 ans'), ('40-44', 'de 40 à 44 ans'),
+    ('45-49', 'de 45 à 49 ans'), ('50-54', 'de 50 à 54 ans'), ('55-59', 'de 55 à 59 ans'),
+    ('60-64', 'de 60 à 64 ans'), ('65-69', 'de 65 à 69 ans'), ('70-74', 'de 70 à 74 ans'),
+    ('75-79', 'de 75 à 79 ans'), ('80-84', 'de 80 à 84 ans'), ('85-89', 'de 85 à 89 ans'),
+    ('90-94', 'de 90 à 94 ans'), ('95et+', 'plus de 95 ans'),
+]
+AGE_TOTAL = ('tsage', 'tous âges')
+SEXES = [(1, 'hommes'), (2, 'femmes')]
+SEX_TOTAL = (9, 'tous sexes')
+
+FIRST_YEAR = 2015
+
+# Level 1 groups of the export; the cancer hierarchy is spelled out, other groups get generic sub-levels
+CANCERS = {
+    'Cancer du sein de la femme': ['Cancer du sein de la femme actif', 'Cancer du sein de la femme sous surveillance'],
+    'Cancer colorectal': ['Cancer colorectal actif', 'Cancer colorectal sous surveillance'],
+    'Cancer du poumon': ['Cancer du poumon actif', 'Cancer du poumon sous surveillance'],
+    'Cancer de la prostate': ['Cancer de la prostate actif', 'Cancer de la prostate sous surveillance'],
+    'Autres cancers': ['Autres cancers actifs', 'Autres cancers sous surveillance'],
+}
+OTHER_GROUPS = [
+    'Maladies cardioneurovasculaires', 'Traitements du risque vasculaire (hors pathologies)', 'Diabète',
+    'Maladies psychiatriques', 'Traitements psychotropes (hors pathologies)', 'Maladies neurologiques',
+    'Maladies respiratoires chroniques (hors mucoviscidose)',
+    'Maladies inflammatoires ou rares ou infection par le VIH',
+    'Insuffisance rénale chronique terminale', 'Maladies du foie ou du pancréas (hors mucoviscidose)',
+    'Maternité (avec ou sans pathologies)', 'Hospitalisations ponctuelles (avec ou sans pathologies, traitements ou maternité)',
+    'Traitements antalgiques ou anti-inflammatoires (hors pathologies, traitements, maternité ou hospitalisations)',
+]
+
+COLUMNS = [
+    'annee', 'patho_niv1', 'patho_niv2', 'patho_niv3', 'top', 'cla_age_5', 'sexe', 'region', 'dept',
+    'Ntop', 'Npop', 'prev', 'niveau_prioritaire', 'libelle_classe_age', 'libelle_sexe', 'tri',
+]
+
+
+def pathologies():
+    # (patho_niv1, patho_niv2, patho_niv3, top) for about eighty indicators, like the real export.
+    # Cancers are interleaved with the other groups so that small datasets still mix both.
+    cancers = [('Cancers', niv2, niv3) for niv2, niv3s in CANCERS.items() for niv3 in niv3s]
+    others = [
+        (niv1, f'{niv1} - groupe {j + 1}', f'{niv1} - groupe {j + 1} - type {k + 1}')
+        for niv1 in OTHER_GROUPS for j in range(3) for k in range(2)
+    ]
+    tops = [top for top in chain.from_iterable(zip_longest(cancers, others)) if top]
+    return [(niv1, niv2, niv3, f'TOP_{n:03d}') for n, (niv1, niv2, niv3) in enumerate(tops)]
+
+
+def _geography():
+    # (region, dept) rows of one block: departments then region totals then the national total
+    rows = []
+    for region, depts in REGIONS.items():
+        rows.extend((region, dept) for dept in depts)
+    rows.extend((region, TOTAL_DEPT) for region in REGIONS)
+    rows.append((NATIONAL_REGION, TOTAL_DEPT))
+    return rows
+
+
+GEOGRAPHY = _geography()
+AGES = AGE_CLASSES + [AGE_TOTAL]
+SEX_ROWS = SEXES + [SEX_TOTAL]
+
+
+def _block(rng, year, pathology, populations):
+    # All rows of one (year, indicator) pair, with totals that are the sums of their detail rows
+    niv1, niv2, niv3, top = pathology
+    rate = rng.uniform(0.002, 0.08) * np.linspace(0.2, 2.0, len(AGE_CLASSES))[None, :, None]
+    npop = populations
+    ntop = np.round(npop * np.clip(rate * rng.lognormal(0, 0.1, npop.shape), 0, 1), -1)
+
+    def with_totals(values):
+        # (depts, ages, sexes) -> (depts, ages + 1, sexes + 1) including the 'tous' margins
+        values = np.concatenate([values, values.sum(axis=1, keepdims=True)], axis=1)
+        return np.concatenate([values, values.sum(axis=2, keepdims=True)], axis=2)
+
+    def geography(values):
+        region_sums, start = [], 0
+        for region_depts in REGIONS.values():
+            region_sums.append(values[start:start + len(region_depts)].sum(axis=0))
+            start += len(region_depts)
+        return np.concatenate([values, np.stack(region_sums), values.sum(axis=0, keepdims=True)])
+
+    npop = geography(with_totals(npop)).reshape(-1)
+    ntop = geography(with_totals(ntop)).reshape(-1)
+
+    region, dept = zip(*GEOGRAPHY)
+    age_code, age_label = zip(*AGES)
+    sex_code, sex_label = zip(*SEX_ROWS)
+    per_geo = len(AGES) * len(SEX_ROWS)
+    frame = pd.DataFrame({
+        'annee': year,
+        'patho_niv1': niv1,
+        'patho_niv2': niv2,
+        'patho_niv3': niv3,
+        'top': top,
+        'cla_age_5': np.tile(np.repeat(age_code, len(SEX_ROWS)), len(GEOGRAPHY)),
+        'sexe': np.tile(sex_code, len(GEOGRAPHY) * len(AGES)),
+        'region': np.repeat(region, per_geo),
+        'dept': np.repeat(dept, per_geo),
+        'Ntop': ntop.astype(np.int64),
+        'Npop': npop.astype(np.int64),
+        'prev': np.round(100 * ntop / np.maximum(npop, 1), 3),
+        'niveau_prioritaire': '2,3',
+        'libelle_classe_age': np.tile(np.repeat(age_label, len(SEX_ROWS)), len(GEOGRAPHY)),
+        'libelle_sexe': np.tile(sex_label, len(GEOGRAPHY) * len(AGES)),
+        'tri': float(int(top[4:])),
+    })
+    return frame[COLUMNS]
+
+
+def iter_blocks(rows, seed=0):
+    # Yield (year, indicator) blocks until at least `rows` rows were produced; years beyond
+    # the real 2015-2022 range are added when one export's worth of rows is not enough
+    rng = np.random.default_rng(seed)
+    tops = pathologies()
+    depts = sum(len(d) for d in REGIONS.values())
+    base = rng.lognormal(8.5, 0.8, (depts, len(AGE_CLASSES), len(SEXES)))
+    produced, year = 0, FIRST_YEAR
+    while produced < rows:
+        populations = np.round(base * (1 + 0.005 * (year - FIRST_YEAR)), -1)
+        for pathology in tops:
+            if produced >= rows:
+                return
+            block = _block(rng, year, pathology, populations)
+            produced += len(block)
+            yield block
+        year += 1
+
+
+def generate(path, rows, seed=0):
+    # Write a synthetic export of at least `rows` rows (a whole number of blocks) and return its row count
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    written = 0
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as handle:
+        for block in iter_blocks(rows, seed):
+            block.to_csv(handle, sep=';', index=False, header=written == 0)
+            written += len(block)
+    os.replace(tmp_path, path)
+    return written
+
+
+def departements_geojson(size=0.3):
+    # Square stand-ins for the department polygons, centred on the marker coordinates
+    features = []
+    for code, (lat, lon) in DEPT_COORDINATES.items():
+        ring = [[lon - size, lat - size], [lon + size, lat - size], [lon + size, lat + size],
+                [lon - size, lat + size], [lon - size, lat - size]]
+        features.append({
+            'type': 'Feature',
+            'properties': {'code': code, 'nom': code},
+            'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def parse_rows(value):
+    # '10k' -> 10000, '1M' -> 1000000
+    value = value.strip().lower()
+    scale = {'k': 10**3, 'm': 10**6}.get(value[-1], 1)
+    return int(float(value[:-1] if scale > 1 else value) * scale)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic ameli-shaped effectifs export")
+    parser.add_argument('path')
+    parser.add_argument('--rows', default='10k', help="minimum number of rows, e.g. 10k, 1M, 10M")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(f"{generate(args.path, parse_rows(args.rows), args.seed)} rows written to {args.path}")
+
+
+if __name__ == '__main__':
+    main()
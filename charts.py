@@ -0,0 +1,308 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import altair as alt
+import pandas as pd
+from streamlit.dataframe_util import convert_anything_to_arrow_bytes
+
+from cube import MEASURES
+
+# Most rows a chart may send to the browser; larger results are folded server-side by within_budget
+ROW_BUDGET = 1000
+
+# Member the smallest series are summed into when a chart is over its row budget
+OTHER = 'Autres'
+
+# Rows of the cancer charts and of the map
+CANCERS = {'patho_niv1': 'Cancers'}
+
+# Cancer cases are the patients of each cancer indicator (Ntop). Unless a chart breaks them down by
+# age class or sex, they are read from the 'tous âges' / 'tous sexes' total rows of the export, so
+# that the detail rows and their totals are not counted together
+CASES = dict(measures=['Ntop'])
+CASE_TOTALS = dict(age='total', sex='total', **CASES)
+
+# Age classes in their natural order rather than alphabetically
+AGE_ORDER = ['de 0 à 4 ans', 'de 5 à 9 ans', 'de 10 à 14 ans', 'de 15 à 19 ans', 'de 20 à 24 ans',
+             'de 25 à 29 ans', 'de 30 à 34 ans', 'de 35 à 39 ans', 'de 40 à 44 ans', 'de 45 à 49 ans',
+             'de 50 à 54 ans', 'de 55 à 59 ans', 'de 60 à 64 ans', 'de 65 à 69 ans', 'de 70 à 74 ans',
+             'de 75 à 79 ans', 'de 80 à 84 ans', 'de 85 à 89 ans', 'de 90 à 94 ans', 'plus de 95 ans']
+
+# Charts of tab2 by what they depend on besides the dataset: nothing, the selected year or the selected department
+DATASET_CHARTS = ['chart_sexe', 'chart_age', 'chart_year', 'chart_cancers_year', 'chart_cancers_niv2_year', 'chart_cancers_niv3_year']
+YEAR_CHARTS = ['chart_cancers_niv2_year_selected', 'chart_age_sex_cancers_year_selected']
+DEPT_CHARTS = ['chart_cases_year_dept', 'chart_cases_type_dept', 'chart_cases_age_sex_dept']
+
+# Altair data transformers and themes are process-wide settings
+_altair_lock = threading.Lock()
+
+
+def within_budget(frame, series, budget=ROW_BUDGET):
+    # Fit a long-format chart frame into `budget` rows: keep the members of `series` with the
+    # largest totals and sum the others into one OTHER member, so every total stays the same
+    if len(frame) <= budget or series not in frame.columns:
+        return frame
+    measures = [c for c in frame.columns if c in MEASURES]
+    keys = [c for c in frame.columns if c not in measures and c != series]
+    rows_per_member = len(frame) / max(1, frame[series].nunique())
+    keep = max(1, int(budget // rows_per_member) - 1)
+    largest = frame.groupby(series, observed=True)[measures[0]].sum().nlargest(keep).index
+    kept = frame[series].isin(largest)
+    if keys:
+        rest = frame[~kept].groupby(keys, observed=True)[measures].sum().reset_index()
+    else:
+        rest = frame.loc[~kept, measures].sum().to_frame().T
+    rest[series] = OTHER
+    kept_rows = frame[kept].astype({series: 'string'})
+    return pd.concat([kept_rows, rest[frame.columns]], ignore_index=True)
+
+
+def cancer_years(cube):
+    # Years offered by the year selectors
+    return cube.values('annee', where=CANCERS)
+
+
+def cancer_depts(cube):
+    # Departments offered by the department selector (without the '999' all-France total)
+    return sorted(d for d in cube.values('dept', where=CANCERS) if d != '999')
+
+
+# Builders of the charts of tab2: each queries the cube and returns the Altair chart, with the
+# series beyond the row budget folded into OTHER
+
+def chart_sexe(cube):
+    patho_by_sexe = cube.query(['patho_niv1', 'libelle_sexe'], where={'libelle_sexe': ['hommes', 'femmes']})
+    patho_by_sexe = within_budget(patho_by_sexe, 'patho_niv1')
+    return alt.Chart(patho_by_sexe).mark_bar().encode(
+        x=alt.X('patho_niv1:N', title='Type of Pathology'),
+        y=alt.Y('Npop:Q', title='Number of Patients'),
+        color='libelle_sexe:N',
+        tooltip=['patho_niv1', 'libelle_sexe', 'Npop']
+    ).properties(
+        title="Distribution of Pathologies by Gender",
+        width=800
+    ).interactive()
+
+
+def chart_age(cube):
+    patho_by_age = cube.query(['patho_niv1', 'libelle_classe_age'], age='detail', sex='detail')
+    patho_by_age['libelle_classe_age'] = pd.Categorical(patho_by_age['libelle_classe_age'], categories=AGE_ORDER, ordered=True)
+    patho_by_age = patho_by_age.sort_values(by='libelle_classe_age')
+    patho_by_age = within_budget(patho_by_age, 'patho_niv1')
+    return alt.Chart(patho_by_age).mark_bar().encode(
+        x=alt.X('patho_niv1:N', title='Type of Pathology', sort=None),
+        y=alt.Y('Npop:Q', title='Number of Patients'),
+        color=alt.Color('libelle_classe_age:N', sort=AGE_ORDER),
+        tooltip=['patho_niv1', 'libelle_classe_age', 'Npop']
+    ).properties(
+        title="Distribution of Pathologies by Age Group",
+        width=800
+    )
+
+
+def chart_year(cube):
+    patho_by_year = cube.query(['annee', 'patho_niv1'], age='detail', sex='detail')
+    patho_by_year = within_budget(patho_by_year, 'patho_niv1')
+    return alt.Chart(patho_by_year).mark_line().encode(
+        x=alt.X('annee:O', title='Year'),
+        y=alt.Y('Npop:Q', title='Number of Patients'),
+        color='patho_niv1:N',
+        tooltip=['annee', 'patho_niv1', 'Npop']
+    ).properties(
+        title="Trends of Pathologies Over Time",
+        width=800
+    ).interactive()
+
+
+def chart_cancers_year(cube):
+    patho_cancers_by_year = cube.query(['annee'], where=CANCERS, **CASE_TOTALS)
+
+    return alt.Chart(patho_cancers_by_year).mark_line(point=True).encode(
+        x=alt.X('annee:O', title='Year'),
+        y=alt.Y('Ntop:Q', title='Number of Cases'),
+        tooltip=['annee', 'Ntop']
+    ).properties(
+        title="Evolution of Cancer Cases Over Time",
+        width=800
+    ).interactive()
+
+
+def chart_cancers_niv2_year(cube):
+    patho_cancers_niv2_by_year = cube.query(['annee', 'patho_niv2'], where=CANCERS, **CASE_TOTALS)
+    patho_cancers_niv2_by_year = within_budget(patho_cancers_niv2_by_year, 'patho_niv2')
+    return alt.Chart(patho_cancers_niv2_by_year).mark_line(point=True).encode(
+        x=alt.X('annee:O', title='Year'),
+        y=alt.Y('Ntop:Q', title='Number of Cases'),
+        color='patho_niv2:N',
+        tooltip=['annee', 'patho_niv2', 'Ntop']
+    ).properties(
+        title="Evolution of Level 2 Pathologies Linked to Cancers Over Time",
+        width=800
+    ).interactive()
+
+
+def chart_cancers_niv3_year(cube):
+    patho_cancers_niv3_by_year = cube.query(['annee', 'patho_niv3'], where=CANCERS, **CASE_TOTALS)
+    patho_cancers_niv3_by_year = within_budget(patho_cancers_niv3_by_year, 'patho_niv3')
+    return alt.Chart(patho_cancers_niv3_by_year).mark_line(point=True).encode(
+        x=alt.X('annee:O', title='Year'),
+        y=alt.Y('Ntop:Q', title='Number of Cases'),
+        color='patho_niv3:N',
+        tooltip=['annee', 'patho_niv3', 'Ntop']
+    ).properties(
+        title="Evolution of Level 3 Pathologies Linked to Cancers Over Time",
+        width=800
+    ).interactive()
+
+
+def chart_cancers_niv2_year_selected(cube, year_selected):
+    cancers_year_selected = {**CANCERS, 'annee': year_selected}
+    patho_cancers_niv2_year_selected = cube.query(['patho_niv2'], where=cancers_year_selected, **CASE_TOTALS)
+    patho_cancers_niv2_year_selected = within_budget(patho_cancers_niv2_year_selected, 'patho_niv2')
+    return alt.Chart(patho_cancers_niv2_year_selected).mark_bar().encode(
+        x=alt.X('patho_niv2:N', title='Type of Cancer (Level 2)'),
+        y=alt.Y('Ntop:Q', title='Number of Cases'),
+        color='patho_niv2:N',
+        tooltip=['patho_niv2', 'Ntop']
+    ).properties(
+        title=f"Distribution of Cancer Types (Level 2) for the year {year_selected}",
+        width=800
+    ).interactive()
+
+
+def chart_age_sex_cancers_year_selected(cube, year_selected):
+    cancers_year_selected = {**CANCERS, 'annee': year_selected}
+    patho_age_sex_year_selected = cube.query(
+        ['libelle_classe_age', 'libelle_sexe'], where=cancers_year_selected, age='detail', sex='detail', **CASES
+    )
+
+    return alt.Chart(patho_age_sex_year_selected).mark_bar().encode(
+        x=alt.X('libelle_classe_age:N', title="Age Group"),
+        y=alt.Y('Ntop:Q', title="Number of Cases"),
+        color='libelle_sexe:N',
+        tooltip=['libelle_classe_age', 'libelle_sexe', 'Ntop']
+    ).properties(
+        title=f"Distribution of Cancers by Age Group and Gender for the Year {year_selected}",
+        width=800
+    ).configure_axis(
+        labelAngle=-45
+    ).interactive()
+
+
+def chart_cases_year_dept(cube, dept_selected):
+    cancers_dept = {**CANCERS, 'dept': dept_selected}
+    cases_by_year_dept = cube.query('annee', where=cancers_dept, **CASE_TOTALS)
+
+    return alt.Chart(cases_by_year_dept).mark_line(point=True).encode(
+        x=alt.X('annee:O', title='Year'),
+        y=alt.Y('Ntop:Q', title='Number of Cases'),
+        tooltip=['annee', 'Ntop']
+    ).properties(
+        title=f"Evolution of Cancer Cases in Department {dept_selected}",
+        width=800
+    ).interactive()
+
+
+def chart_cases_type_dept(cube, dept_selected):
+    cancers_dept = {**CANCERS, 'dept': dept_selected}
+    cases_by_type_dept = cube.query('patho_niv2', where=cancers_dept, **CASE_TOTALS)
+    cases_by_type_dept = within_budget(cases_by_type_dept, 'patho_niv2')
+    return alt.Chart(cases_by_type_dept).mark_bar().encode(
+        x=alt.X('patho_niv2:N', title='Type of Cancer (Level 2)', sort=None),
+        y=alt.Y('Ntop:Q', title='Number of Cases'),
+        color='patho_niv2:N',
+        tooltip=['patho_niv2', 'Ntop']
+    ).properties(
+        title=f"Distribution of Cancer Types in Department {dept_selected}",
+        width=800
+    ).interactive()
+
+
+def chart_cases_age_sex_dept(cube, dept_selected):
+    cancers_dept = {**CANCERS, 'dept': dept_selected}
+    cases_by_age_sex_dept = cube.query(['libelle_classe_age', 'libelle_sexe'], where=cancers_dept, age='detail', sex='detail', **CASES)
+
+    return alt.Chart(cases_by_age_sex_dept).mark_bar().encode(
+        x=alt.X('libelle_classe_age:N', title="Age Group"),
+        y=alt.Y('Ntop:Q', title="Number of Cases"),
+        color='libelle_sexe:N',
+        tooltip=['libelle_classe_age', 'libelle_sexe', 'Ntop']
+    ).properties(
+        title=f"Distribution of Cancer Cases by Age Group and Gender in Department {dept_selected}",
+        width=800
+    ).configure_axis(
+        labelAngle=-45
+    ).interactive()
+
+
+def _arrow_datasets(data, datasets):
+    # Altair data transformer: the chart data as Arrow bytes named after their content, which
+    # st.vega_lite_chart passes to the browser as they are instead of serializing them again
+    payload = convert_anything_to_arrow_bytes(data)
+    name = hashlib.sha1(payload).hexdigest()[:16]
+    datasets[name] = payload
+    return {'name': name}
+
+
+alt.data_transformers.register('arrow_datasets', _arrow_datasets)
+
+
+def to_spec(chart):
+    # Vega-Lite spec of an Altair chart, like st.altair_chart builds it (no default theme sizes)
+    datasets = {}
+    with _altair_lock, alt.theme.enable('none'), alt.data_transformers.enable('arrow_datasets', datasets=datasets):
+        spec = chart.to_dict()
+    spec['datasets'] = {**spec.get('datasets', {}), **datasets}
+    return spec
+
+
+def to_json_spec(chart):
+    # Self-contained Vega-Lite spec, its data inlined as JSON, for any Vega-Lite renderer (e.g. vega-embed)
+    with _altair_lock, alt.theme.enable('none'), alt.data_transformers.enable('default', max_rows=None):
+        return chart.to_dict()
+
+
+def spec_bytes(spec):
+    # Size of a spec on the wire: its Arrow datasets plus the JSON of the rest
+    datasets = spec.get('datasets', {})
+    rest = {key: value for key, value in spec.items() if key != 'datasets'}
+    return sum(len(data) for data in datasets.values() if isinstance(data, bytes)) + len(json.dumps(rest))
+
+
+class SpecCache:
+    # Built chart specs keyed by their inputs, e.g. (chart, dataset version, year), shared by every
+    # session: a chart whose inputs did not change is sent again without querying or serializing
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._specs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build, *args):
+        # Spec of the chart `build(*args)` returns, built on the first request for `key` only
+        with self._lock:
+            spec = self._specs.get(key)
+            if spec is not None:
+                self._specs.move_to_end(key)
+                self.hits += 1
+                return spec
+            self.misses += 1
+        spec = to_spec(build(*args))
+        with self._lock:
+            self._specs[key] = spec
+            while len(self._specs) > self.max_entries:
+                self._specs.popitem(last=False)
+        return spec
+
+    def stats(self):
+        with self._lock:
+            return {
+                'specs': len(self._specs),
+                'hits': self.hits,
+                'misses': self.misses,
+                'bytes': sum(spec_bytes(spec) for spec in self._specs.values()),
+            }
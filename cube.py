@@ -0,0 +1,183 @@
+import threading
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+import rates
+from ingest import where_mask
+
+# Dimensions of the cube, from the coarsest to the finest grain of the ameli export
+DIMENSIONS = ['annee', 'patho_niv1', 'patho_niv2', 'patho_niv3', 'region', 'dept', 'cla_age_5', 'sexe']
+
+# Display labels carried alongside the code they describe (one label per code, so they add no cells)
+LABELS = {'libelle_classe_age': 'cla_age_5', 'libelle_sexe': 'sexe'}
+
+# Measures a query can ask for: case counts and populations, summed by every roll-up, and the
+# prevalence, computed from those sums (see rates.py)
+MEASURES = ['Npop', 'Ntop', 'prev']
+
+# Members holding the pre-computed totals of the export rather than a real age class or sex
+AGE_TOTAL = 'tsage'
+SEX_TOTAL = 9
+
+# Roll-ups covering every query of tab2, materialised up front (and the only ones kept when the raw
+# rows are never held in memory). The department roll-ups carry the region, which adds no cells.
+SUMMARY_CUBOIDS = [
+    ['annee', 'patho_niv1', 'patho_niv2', 'patho_niv3', 'cla_age_5', 'sexe'],
+    ['annee', 'patho_niv1', 'region', 'dept'],
+    ['patho_niv1', 'patho_niv2', 'region', 'dept'],
+    ['patho_niv1', 'region', 'dept', 'cla_age_5', 'sexe'],
+]
+
+# Dimensions with a row-position index on every roll-up, so that a drilldown on one member
+# only touches that member's rows
+INDEXED_DIMENSIONS = ['dept', 'region']
+
+
+def rollup(frame, keys):
+    # Sum the measures of `frame` over the dimensions in `keys` (plus the labels of those dimensions)
+    # and compute the prevalence of every resulting cell from the sums
+    frame = rates.with_denominator(frame)
+    columns = [d for d in DIMENSIONS if d in keys]
+    columns += [label for label, code in LABELS.items() if code in keys and label in frame.columns]
+    measures = [m for m in rates.ADDITIVE if m in frame.columns]
+    grouped = frame.groupby(columns, observed=True, sort=False, dropna=False)
+    return rates.with_rates(grouped[measures].sum().reset_index())
+
+
+def concat(frames):
+    # Concatenate partial aggregates whose categoricals were inferred chunk by chunk
+    merged = pd.concat(frames, ignore_index=True)
+    for column in frames[0].columns:
+        if all(isinstance(f[column].dtype, pd.CategoricalDtype) for f in frames):
+            merged[column] = union_categoricals([f[column] for f in frames])
+    return merged
+
+
+class Cube:
+    # Aggregates of the pathology dataset over DIMENSIONS, with memoised roll-ups (cuboids)
+    # so that each chart query groups a small pre-aggregated table instead of the raw rows.
+
+    def __init__(self, cuboids, rows):
+        self.rows = rows
+        self._cuboids = {frozenset(c for c in frame.columns if c in DIMENSIONS): frame for frame in cuboids}
+        self._indexes = {}
+        self._lock = threading.Lock()
+        for keys in map(frozenset, SUMMARY_CUBOIDS):
+            if any(keys <= dims for dims in self._cuboids):
+                self.cuboid(keys)
+                for column in INDEXED_DIMENSIONS:
+                    if column in keys:
+                        self.positions(keys, column)
+
+    @classmethod
+    def from_frame(cls, data):
+        return cls([rollup(data, DIMENSIONS)], rows=len(data))
+
+    @classmethod
+    def from_chunks(cls, chunks, cuboids=SUMMARY_CUBOIDS):
+        # Fold a stream of row chunks into the requested roll-ups; memory is bounded by the
+        # cardinality of those roll-ups and the chunk size, never by the number of rows
+        partials = {frozenset(keys): None for keys in cuboids}
+        rows = 0
+        for chunk in chunks:
+            rows += len(chunk)
+            for keys, partial in partials.items():
+                part = rollup(chunk, keys)
+                partials[keys] = part if partial is None else rollup(concat([partial, part]), keys)
+        return cls([frame for frame in partials.values() if frame is not None], rows=rows)
+
+    @classmethod
+    def merge(cls, parts):
+        # Cube of several datasets sharing no cell, e.g. one cube per year: the roll-ups over 'annee'
+        # are the concatenation of those of the parts, the others the sum of them (small tables),
+        # so replacing one part never regroups the rows of the others
+        cuboids = []
+        for dims in frozenset.intersection(*(frozenset(part._cuboids) for part in parts)):
+            merged = concat([part._cuboids[dims] for part in parts])
+            cuboids.append(merged if 'annee' in dims else rollup(merged, dims))
+        return cls(cuboids, rows=sum(part.rows for part in parts))
+
+    @property
+    def measures(self):
+        frame = next(iter(self._cuboids.values()))
+        return [m for m in MEASURES if m in frame.columns]
+
+    def cuboid(self, keys):
+        # Return the roll-up over `keys`, computed from the smallest materialised ancestor
+        keys = frozenset(keys)
+        cuboid = self._cuboids.get(keys)
+        if cuboid is not None:
+            return cuboid
+        with self._lock:
+            parents = [frame for dims, frame in self._cuboids.items() if keys <= dims]
+            if not parents:
+                raise KeyError(f"no materialised roll-up covers {sorted(keys)}")
+            cuboid = rollup(min(parents, key=len), keys)
+            self._cuboids[keys] = cuboid
+        return cuboid
+
+    def _covering(self, keys):
+        # Smallest materialised roll-up containing every dimension of `keys`; iterates a copy of the
+        # roll-ups, which cuboid() may extend from another session's thread meanwhile
+        candidates = [(len(frame), dims) for dims, frame in list(self._cuboids.items()) if keys <= dims]
+        if not candidates:
+            raise KeyError(f"no materialised roll-up covers {sorted(keys)}")
+        return min(candidates, key=lambda candidate: candidate[0])[1]
+
+    def positions(self, dims, column):
+        # Row positions of each member of `column` in the roll-up over `dims`
+        index = self._indexes.get((dims, column))
+        if index is None:
+            with self._lock:
+                grouped = self._cuboids[dims].groupby(column, observed=True, sort=False)
+                index = {value: rows for value, rows in grouped.indices.items()}
+                self._indexes[(dims, column)] = index
+        return index
+
+    def query(self, by, where=None, age=None, sex=None, measures=('Npop',)):
+        # Sum `measures` grouped by `by` (dimensions or their labels), like
+        # data[mask].groupby(by)[measures].sum().reset_index() on the raw rows; a prevalence
+        # is computed from the summed case counts and populations of its group instead.
+        # `where` maps a column to a value or a list of accepted values.
+        # `age` / `sex` select the 'tous âges' / 'tous sexes' total rows explicitly:
+        # None keeps every row, 'detail' drops the totals and 'total' keeps only them.
+        by = [by] if isinstance(by, str) else list(by)
+        where = dict(where or {})
+        columns = by + list(where)
+        if age is not None:
+            columns.append('cla_age_5')
+        if sex is not None:
+            columns.append('sexe')
+        keys = frozenset(LABELS.get(c, c) for c in columns)
+
+        indexed = [
+            c for c in INDEXED_DIMENSIONS
+            if c in where and not isinstance(where[c], (list, tuple, set, frozenset))
+        ]
+        if indexed:
+            # Drilldown: take the rows of that member straight from the index of a covering roll-up
+            dims = self._covering(keys)
+            rows = self.positions(dims, indexed[0]).get(where.pop(indexed[0]), np.empty(0, dtype=np.intp))
+            frame = self._cuboids[dims].take(rows)
+        else:
+            frame = self.cuboid(keys)
+
+        mask = where_mask(frame, where)
+        for column, total, mode in (('cla_age_5', AGE_TOTAL, age), ('sexe', SEX_TOTAL, sex)):
+            if mode == 'detail':
+                mask &= frame[column] != total
+            elif mode == 'total':
+                mask &= frame[column] == total
+            elif mode is not None:
+                raise ValueError(f"unknown total selection {mode!r}, expected 'detail' or 'total'")
+
+        grouped = frame[mask].groupby(by, observed=True)[rates.summed(measures)].sum().reset_index()
+        return rates.with_rates(grouped)[by + list(measures)]
+
+    def values(self, column, where=None):
+        # Distinct values of a dimension, in order of first appearance like Series.unique()
+        where = dict(where or {})
+        frame = self.cuboid({LABELS.get(c, c) for c in [column, *where]})
+        return frame[where_mask(frame, where)][column].unique()
@@ -0,0 +1,175 @@
+import os
+
+import duckdb
+
+from cube import AGE_TOTAL, DIMENSIONS, LABELS, MEASURES, SEX_TOTAL
+from ingest import AGE_CLASS_FIXES, CATEGORY_COLUMNS, NUMERIC_DTYPES, canonical_name
+from rates import RATE_SCALE
+from settings import CACHE_DIR
+
+# Query engine answering the same queries as cube.Cube with SQL run by DuckDB over the Parquet
+# snapshot, so the dataset never has to fit in memory: DuckDB reads only the columns a query uses
+# (projection pushdown), skips the row groups its filters exclude (predicate pushdown), runs every
+# query on all cores and spills to the cache directory when an aggregation outgrows the memory limit.
+# Selected with PORTFOLIO_QUERY_ENGINE=duckdb; cube.Cube remains the default.
+
+# SQL types of the snapshot columns, mirroring ingest.NUMERIC_DTYPES (labels stay VARCHAR)
+SQL_TYPES = {
+    'annee': 'SMALLINT',
+    'sexe': 'TINYINT',
+    'region': 'TINYINT',
+    'Npop': 'BIGINT',
+    'Ntop': 'BIGINT',
+    'prev': 'FLOAT',
+    'tri': 'FLOAT',
+}
+
+# Fields pandas.read_csv reads as missing by default, so both engines see the same nulls
+NA_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+]
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def literal(text):
+    return "'" + str(text).replace("'", "''") + "'"
+
+
+def connect(cache_dir=CACHE_DIR):
+    # In-memory database whose operators spill to the cache directory instead of failing when out of memory
+    connection = duckdb.connect()
+    os.makedirs(cache_dir, exist_ok=True)
+    connection.execute(f"SET temp_directory = {literal(os.path.join(cache_dir, 'duckdb'))}")
+    return connection
+
+
+def _column_sql(source, name):
+    # SQL expression giving column `name` of the raw export (`source`) its typed, cleaned value,
+    # as ingest.apply_schema does for pandas
+    column = quote(source)
+    if name == 'dept':
+        # Metropolitan departments are two characters ('01', '2A'), overseas ones three ('971')
+        code = f'trim({column})'
+        return f"CASE WHEN regexp_full_match({code}, '[0-9]+') AND length({code}) < 2 THEN lpad({code}, 2, '0') ELSE {code} END"
+    if name == 'cla_age_5':
+        fixes = ' '.join(f'WHEN {literal(bad)} THEN {literal(good)}' for bad, good in AGE_CLASS_FIXES.items())
+        return f'CASE {column} {fixes} ELSE {column} END'
+    if name in SQL_TYPES:
+        return f'TRY_CAST(TRY_CAST({column} AS DOUBLE) AS {SQL_TYPES[name]})'
+    return column
+
+
+def write_parquet(csv_path, path, connection=None):
+    # Convert the export to the Parquet snapshot inside DuckDB, streaming it in bounded memory; the
+    # row order of the export is kept, as DuckCube.values() reports members by first appearance.
+    # The snapshot is only replaced by one holding every column the queries use: an export that
+    # lacks some raises ValueError and leaves the previous snapshot in place.
+    connection = connection or connect()
+    csv = (f"read_csv({literal(csv_path)}, delim=';', header=true, all_varchar=true, "
+           f"nullstr=[{', '.join(map(literal, NA_VALUES))}])")
+    columns = [row[0] for row in connection.execute(f'DESCRIBE SELECT * FROM {csv}').fetchall()]
+    select = ', '.join(f'{_column_sql(c, canonical_name(c))} AS {quote(canonical_name(c))}' for c in columns)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        connection.execute(f'COPY (SELECT {select} FROM {csv}) TO {literal(tmp_path)} (FORMAT parquet)')
+        written = {row[0] for row in connection.execute(f'DESCRIBE SELECT * FROM read_parquet({literal(tmp_path)})').fetchall()}
+        missing = [column for column in DIMENSIONS + list(LABELS) + MEASURES if column not in written]
+        if missing:
+            raise ValueError(f"{csv_path} is missing the columns {missing}")
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+def _measure_sql(measure):
+    # Aggregate giving `measure` for a group of rows, as cube.Cube.query computes it
+    if measure == 'prev':
+        population = 'sum(CASE WHEN "Ntop" IS NOT NULL THEN "Npop" END)'
+        return f'CAST({RATE_SCALE} * sum("Ntop") / nullif({population}, 0) AS {SQL_TYPES[measure]})'
+    return f'coalesce(CAST(sum({quote(measure)}) AS {SQL_TYPES[measure]}), 0)'
+
+
+def _pandas_dtype(column):
+    if column in CATEGORY_COLUMNS:
+        return 'category'
+    return NUMERIC_DTYPES.get(column)
+
+
+def to_frame(result):
+    # Result of a query with the dtypes the pandas engine gives the same columns
+    frame = result.df()
+    dtypes = {column: _pandas_dtype(column) for column in frame.columns if _pandas_dtype(column)}
+    return frame.astype(dtypes)
+
+
+class DuckCube:
+    # Same interface as cube.Cube (rows, measures, query, values) over a Parquet snapshot
+
+    def __init__(self, path, connection=None):
+        self.path = path
+        self._connection = connection or connect()
+        self._source = f'read_parquet({literal(path)})'
+        described = self._cursor().execute(f'DESCRIBE SELECT * FROM {self._source}').fetchall()
+        self._columns = [row[0] for row in described]
+        self.rows = self._cursor().execute(f'SELECT count(*) FROM {self._source}').fetchone()[0]
+
+    def _cursor(self):
+        # Cursors of one connection can run queries from several threads (sessions) at once
+        return self._connection.cursor()
+
+    @property
+    def measures(self):
+        return [m for m in MEASURES if m in self._columns]
+
+    def _conditions(self, where, age=None, sex=None):
+        # WHERE clause and its parameters for the `where`, `age` and `sex` arguments of Cube.query
+        conditions, parameters = [], []
+        for column, value in (where or {}).items():
+            if isinstance(value, (list, tuple, set, frozenset)):
+                values = [getattr(v, 'item', lambda v=v: v)() for v in value]
+                if not values:
+                    conditions.append('false')
+                    continue
+                conditions.append(f"{quote(column)} IN ({', '.join('?' for _ in values)})")
+                parameters += values
+            else:
+                conditions.append(f'{quote(column)} = ?')
+                parameters.append(getattr(value, 'item', lambda: value)())
+        for column, total, mode in (('cla_age_5', AGE_TOTAL, age), ('sexe', SEX_TOTAL, sex)):
+            if mode == 'detail':
+                conditions.append(f'{quote(column)} != ?')
+            elif mode == 'total':
+                conditions.append(f'{quote(column)} = ?')
+            elif mode is not None:
+                raise ValueError(f"unknown total selection {mode!r}, expected 'detail' or 'total'")
+            else:
+                continue
+            parameters.append(total)
+        return conditions, parameters
+
+    def query(self, by, where=None, age=None, sex=None, measures=('Npop',)):
+        # Sum `measures` grouped by `by`, with the rows, order and dtypes of Cube.query: groups
+        # sorted by their keys, missing keys dropped, the sum of only missing values being 0 and
+        # the prevalence computed from the case counts and the population behind them (rates.py)
+        by = [by] if isinstance(by, str) else list(by)
+        conditions, parameters = self._conditions(where, age, sex)
+        conditions += [f'{quote(column)} IS NOT NULL' for column in by]
+        keys = ', '.join(map(quote, by))
+        sums = ', '.join(f'{_measure_sql(m)} AS {quote(m)}' for m in measures)
+        sql = f"SELECT {keys}, {sums} FROM {self._source} WHERE {' AND '.join(conditions)} GROUP BY {keys} ORDER BY {keys}"
+        return to_frame(self._cursor().execute(sql, parameters))
+
+    def values(self, column, where=None):
+        # Distinct values of a dimension, in order of first appearance like Series.unique()
+        conditions, parameters = self._conditions(where)
+        source = f'read_parquet({literal(self.path)}, file_row_number=true)'
+        clause = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        sql = f'SELECT {quote(column)} FROM {source} {clause} GROUP BY {quote(column)} ORDER BY min(file_row_number)'
+        return to_frame(self._cursor().execute(sql, parameters))[column].to_numpy()
@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+import time
+
+import charts
+from geo import load_departements
+from ingest import iter_pages
+from maps import MAP_ZOOM, base_map, cases_colormap, dept_values, year_data, year_layer
+from refresh import Refresher
+from settings import DATA_URL
+
+# Static export of tab2: every chart, map and preview page the app can show for the current release
+# of the dataset, computed once so that a static viewer can serve them from a CDN or object storage
+# without any Python running per visitor. The output directory holds:
+# - manifest.json: dataset version, years, departments, number of preview pages and every file below;
+# - charts/<chart>.json and charts/<chart>/<year or department>.json: Vega-Lite specs with inline data;
+# - maps/<year>.html: the complete folium map of each year;
+# - preview/<page>.json: the rows of each preview page (numbered from 1 as in the app), in the
+#   pandas "split" layout {"columns": [...], "data": [[...], ...]}.
+
+# Rows per preview page, as in the data overview of portfolio.py
+ROWS_PER_PAGE = 100
+
+
+def write_json(obj, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as handle:
+        json.dump(obj, handle, ensure_ascii=False, separators=(',', ':'))
+
+
+def export_charts(cube, output):
+    # Spec of every chart for every value of its selector; returns {chart: path or {value: path}}
+    years = [int(year) for year in charts.cancer_years(cube)]
+    depts = charts.cancer_depts(cube)
+    files = {}
+    for name in charts.DATASET_CHARTS:
+        files[name] = f'charts/{name}.json'
+        write_json(charts.to_json_spec(getattr(charts, name)(cube)), os.path.join(output, files[name]))
+    for names, values in ((charts.YEAR_CHARTS, years), (charts.DEPT_CHARTS, depts)):
+        for name in names:
+            files[name] = {}
+            for value in values:
+                files[name][value] = f'charts/{name}/{value}.json'
+                write_json(charts.to_json_spec(getattr(charts, name)(cube, value)), os.path.join(output, files[name][value]))
+    return years, depts, files
+
+
+def export_maps(cube, years, output):
+    # One self-contained HTML map per year: the base map with the layer of that year added
+    values = dept_values(cube, charts.CANCERS)
+    geojson = load_departements(MAP_ZOOM)
+    files = {}
+    for year in years:
+        colormap = cases_colormap(values)
+        m = base_map(geojson, colormap)
+        year_layer(*year_data(values[values['annee'] == year], colormap), year).add_to(m)
+        files[year] = f'maps/{year}.html'
+        os.makedirs(os.path.join(output, 'maps'), exist_ok=True)
+        m.save(os.path.join(output, files[year]))
+    return files
+
+
+def export_preview(release, output, max_pages=None):
+    # Preview pages in one pass over the snapshot (or over the CSV copy when there is no snapshot)
+    if release.data is not None:
+        pages = (release.data.page(start, ROWS_PER_PAGE) for start in range(0, len(release.data), ROWS_PER_PAGE))
+    else:
+        pages = iter_pages(release.path, ROWS_PER_PAGE)
+    count = 0
+    for number, page in enumerate(pages, start=1):
+        if max_pages is not None and number > max_pages:
+            break
+        path = os.path.join(output, 'preview', f'{number}.json')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        page.to_json(path, orient='split', index=False, force_ascii=False)
+        count = number
+    return count
+
+
+def export(source, output, max_pages=None):
+    release = Refresher(source, interval=0).current()
+    years, depts, chart_files = export_charts(release.cube, output)
+    manifest = {
+        'version': release.version,
+        'rows': release.cube.rows,
+        'rows_per_page': ROWS_PER_PAGE,
+        'years': years,
+        'depts': depts,
+        'charts': chart_files,
+        'maps': export_maps(release.cube, years, output),
+        'pages': export_preview(release, output, max_pages),
+    }
+    # Written last: a viewer reading the manifest only finds files that already exist
+    write_json(manifest, os.path.join(output, 'manifest.json'))
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write every chart, map and preview page of the analysis tab as static files")
+    parser.add_argument('output', help="directory to write to, e.g. to sync to a CDN or a bucket afterwards")
+    parser.add_argument('--source', default=DATA_URL, help="dataset to export (PORTFOLIO_DATA_URL by default)")
+    parser.add_argument('--max-pages', type=int, help="only export the first preview pages")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    manifest = export(args.source, args.output, args.max_pages)
+    charts_written = sum(1 if isinstance(files, str) else len(files) for files in manifest['charts'].values())
+    print(f"{charts_written} charts, {len(manifest['maps'])} maps and {manifest['pages']} preview pages "
+          f"written to {args.output} in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
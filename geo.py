@@ -0,0 +1,218 @@
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from settings import CACHE_DIR, GEOJSON_PATH, GEOJSON_RETRY_SECONDS, GEOJSON_URL, HTTP_TIMEOUT
+
+# Simplification tolerance, in degrees, for each minimum zoom level: the finer the zoom, the more detail
+ZOOM_TOLERANCES = [(10, 0.0), (8, 0.001), (6, 0.005), (0, 0.02)]
+
+# Coordinates are rounded to about one metre in the simplified variants
+COORDINATE_DECIMALS = 5
+
+# Simplified variants committed with the app (`python geo.py` writes them), read when the on-disk
+# cache has none: the map then never needs the network
+BUNDLE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def tolerance_for_zoom(zoom):
+    return next(tolerance for min_zoom, tolerance in ZOOM_TOLERANCES if zoom >= min_zoom)
+
+
+def _variant_path(tolerance, cache_dir):
+    return os.path.join(cache_dir, 'geo', f'departements-{tolerance:g}.geojson')
+
+
+def _failure_path(cache_dir):
+    # Marker of the last failed download: its modification time is when it failed
+    return os.path.join(cache_dir, 'geo', 'departements.failed')
+
+
+def _write_json(obj, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as handle:
+        json.dump(obj, handle, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    with open(path, encoding='utf-8') as handle:
+        return json.load(handle)
+
+
+def fetch(url=GEOJSON_URL, retries=3):
+    # Download with a timeout and exponential back-off on connection errors and 5xx answers
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504])
+    session.mount('https://', HTTPAdapter(max_retries=retry))
+    session.mount('http://', HTTPAdapter(max_retries=retry))
+    response = session.get(url, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+def load_source(cache_dir=CACHE_DIR):
+    # Full-resolution departments: bundled file, then the copy cached on disk, then the network.
+    # A failed download is remembered for GEOJSON_RETRY_SECONDS, so that the reruns in between fail
+    # at once instead of each waiting for the retries and their back-off again.
+    cached = _variant_path(0.0, cache_dir)
+    for path in (GEOJSON_PATH, cached):
+        if path and os.path.exists(path):
+            return _read_json(path)
+    failure = _failure_path(cache_dir)
+    if os.path.exists(failure):
+        elapsed = time.time() - os.path.getmtime(failure)
+        if elapsed < GEOJSON_RETRY_SECONDS:
+            raise requests.ConnectionError(
+                f"departments download failed {elapsed:.0f} s ago, next attempt in {GEOJSON_RETRY_SECONDS - elapsed:.0f} s"
+            )
+    try:
+        geojson = fetch()
+    except (requests.RequestException, ValueError):
+        os.makedirs(os.path.dirname(failure), exist_ok=True)
+        with open(failure, 'w', encoding='utf-8'):
+            pass
+        raise
+    _write_json(geojson, cached)
+    if os.path.exists(failure):
+        os.remove(failure)
+    return geojson
+
+
+def _simplify_line(points, tolerance):
+    # Douglas-Peucker on an (n, 2) array; both end points are always kept
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = points[first], points[last]
+        segment = points[first + 1:last]
+        direction = end - start
+        length = np.hypot(*direction)
+        if length == 0:
+            distances = np.hypot(*(segment - start).T)
+        else:
+            offset = segment - start
+            distances = np.abs(direction[0] * offset[:, 1] - direction[1] * offset[:, 0]) / length
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            middle = first + 1 + index
+            keep[middle] = True
+            stack.append((first, middle))
+            stack.append((middle, last))
+    return points[keep]
+
+
+def _junctions(rings):
+    # Points where a shared border starts or ends: they have more than two distinct neighbours
+    neighbours = {}
+    for ring in rings:
+        for i, point in enumerate(ring[:-1]):
+            around = neighbours.setdefault(point, set())
+            around.add(ring[i - 1] if i else ring[-2])
+            around.add(ring[i + 1])
+    return {point for point, around in neighbours.items() if len(around) > 2}
+
+
+def _simplify_ring(ring, junctions, tolerance, arcs):
+    # Cut the ring at junctions and simplify each arc once, so that the borders shared by two
+    # departments are simplified identically on both sides and no gap or overlap appears
+    cuts = [i for i, point in enumerate(ring[:-1]) if point in junctions]
+    if not cuts:
+        simplified = _simplify_line(np.array(ring), tolerance)
+        return [tuple(p) for p in simplified] if len(simplified) >= 4 else ring
+    ring = ring[cuts[0]:-1] + ring[:cuts[0] + 1]
+    cuts = [i - cuts[0] for i in cuts] + [len(ring) - 1]
+    result = [ring[0]]
+    for first, last in zip(cuts, cuts[1:]):
+        arc = tuple(ring[first:last + 1])
+        key = min(arc, arc[::-1])
+        if key not in arcs:
+            arcs[key] = [tuple(p) for p in _simplify_line(np.array(key), tolerance)]
+        simplified = arcs[key] if key == arc else arcs[key][::-1]
+        result.extend(simplified[1:])
+    return result if len(result) >= 4 else ring
+
+
+def _polygons(geometry):
+    if not geometry:
+        return []
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    return []
+
+
+def simplify(geojson, tolerance):
+    # Topology-preserving simplification of a FeatureCollection of (multi)polygons
+    rings = [
+        [tuple(point) for point in ring]
+        for feature in geojson['features']
+        for polygon in _polygons(feature['geometry'])
+        for ring in polygon
+    ]
+    junctions = _junctions(rings)
+    arcs = {}
+    rings = iter(rings)
+    features = []
+    for feature in geojson['features']:
+        geometry = feature['geometry']
+        polygons = [
+            [
+                np.round(_simplify_ring(next(rings), junctions, tolerance, arcs), COORDINATE_DECIMALS).tolist()
+                for _ in polygon
+            ]
+            for polygon in _polygons(geometry)
+        ]
+        if geometry['type'] == 'Polygon':
+            geometry = {'type': 'Polygon', 'coordinates': polygons[0]}
+        elif geometry['type'] == 'MultiPolygon':
+            geometry = {'type': 'MultiPolygon', 'coordinates': polygons}
+        features.append({'type': 'Feature', 'geometry': geometry, 'properties': feature['properties']})
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def write_variants(source, directory):
+    # Every simplified variant of the full-resolution `source`, as departements-<tolerance>.geojson
+    for _, tolerance in ZOOM_TOLERANCES:
+        if tolerance:
+            _write_json(simplify(source, tolerance), _variant_path(tolerance, directory))
+
+
+def load_departements(zoom, cache_dir=CACHE_DIR):
+    # Department polygons simplified for `zoom`: on-disk cache, then the bundled variant, then
+    # computed once from the full-resolution source and kept on disk
+    tolerance = tolerance_for_zoom(zoom)
+    path = _variant_path(tolerance, cache_dir)
+    bundled = os.path.join(BUNDLE_DIR, os.path.basename(path))
+    for candidate in (path, bundled):
+        if os.path.exists(candidate):
+            return _read_json(candidate)
+    source = load_source(cache_dir)
+    if tolerance == 0.0:
+        return source
+    write_variants(source, cache_dir)
+    return _read_json(path)
+
+
+if __name__ == '__main__':
+    # Bundle the simplified variant of the map zoom next to this file: python geo.py [zoom]
+    from maps import MAP_ZOOM
+
+    zoom = int(sys.argv[1]) if len(sys.argv) > 1 else MAP_ZOOM
+    tolerance = tolerance_for_zoom(zoom)
+    simplified = simplify(load_source(), tolerance) if tolerance else load_source()
+    target = os.path.join(BUNDLE_DIR, f'departements-{tolerance:g}.geojson')
+    _write_json(simplified, target)
+    print(f"{len(simplified['features'])} departments written to {target}")
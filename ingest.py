@@ -0,0 +1,186 @@
+import hashlib
+import os
+import shutil
+from contextlib import contextmanager
+
+import pandas as pd
+import requests
+
+from settings import CACHE_DIR, HTTP_TIMEOUT, MEMORY_BUDGET_MB
+
+# Canonical column names: the remote export capitalises the counts while the bundled effectifs.csv does not
+COLUMN_ALIASES = {'npop': 'Npop', 'ntop': 'Ntop'}
+
+# Label columns stored as categoricals instead of one Python string per row
+CATEGORY_COLUMNS = [
+    'patho_niv1', 'patho_niv2', 'patho_niv3', 'top', 'cla_age_5', 'dept',
+    'niveau_prioritaire', 'libelle_classe_age', 'libelle_sexe',
+]
+
+# Numeric columns downcast to the smallest type that holds the ameli values (counts stay 64-bit so sums cannot overflow)
+NUMERIC_DTYPES = {
+    'annee': 'int16',
+    'sexe': 'int8',
+    'region': 'int8',
+    'Npop': 'Int64',
+    'Ntop': 'Int64',
+    'prev': 'float32',
+    'tri': 'float32',
+}
+
+# Age classes mangled into dates by spreadsheet software in some exports
+AGE_CLASS_FIXES = {'05-sept': '05-09', 'oct-14': '10-14'}
+
+
+# Rough in-memory cost of one parsed CSV field, used to size chunks from the memory budget
+BYTES_PER_FIELD = 64
+
+
+def canonical_name(column):
+    name = column.strip().lstrip('﻿').lower()
+    return COLUMN_ALIASES.get(name, name)
+
+
+def normalize_columns(data):
+    # Map the column names of any export flavour onto the names used by the app
+    return data.rename(columns={column: canonical_name(column) for column in data.columns})
+
+
+def _pad_dept(code):
+    # Metropolitan departments are two characters ('01', '2A'), overseas ones three ('971')
+    code = str(code).strip()
+    return code.zfill(2) if code.isdigit() else code
+
+
+def _recode(series, mapping):
+    # Rewrite categorical labels without expanding the column back to strings
+    categories = series.cat.categories
+    renamed = [mapping(c) for c in categories]
+    if len(set(renamed)) == len(renamed):
+        return series.cat.rename_categories(renamed)
+    return series.astype(str).map(mapping).astype('category')
+
+
+def apply_schema(data):
+    # Coerce a freshly parsed frame to the compact typed schema
+    data = normalize_columns(data)
+    for column in CATEGORY_COLUMNS:
+        if column in data.columns and not isinstance(data[column].dtype, pd.CategoricalDtype):
+            data[column] = data[column].astype('string').astype('category')
+    if 'dept' in data.columns:
+        data['dept'] = _recode(data['dept'], _pad_dept)
+    if 'cla_age_5' in data.columns:
+        data['cla_age_5'] = _recode(data['cla_age_5'], lambda c: AGE_CLASS_FIXES.get(c, c))
+    for column, dtype in NUMERIC_DTYPES.items():
+        if column in data.columns and data[column].dtype != dtype:
+            data[column] = pd.to_numeric(data[column], errors='coerce').astype(dtype)
+    return data
+
+
+def _parse_dtypes():
+    dtype = {column: 'category' for column in CATEGORY_COLUMNS}
+    dtype['dept'] = 'string'
+    return dtype
+
+
+def read_csv(source, **kwargs):
+    # Parse the export straight into categoricals so strings are never materialised per row
+    return apply_schema(pd.read_csv(source, delimiter=';', dtype=_parse_dtypes(), **kwargs))
+
+
+def where_mask(frame, where):
+    # Boolean mask of the rows matching every `column: value` (or `column: [values]`) condition
+    mask = pd.Series(True, index=frame.index)
+    for column, value in (where or {}).items():
+        if isinstance(value, (list, tuple, set, frozenset)):
+            mask &= frame[column].isin(list(value))
+        else:
+            mask &= frame[column] == value
+    return mask
+
+
+def chunk_rows(columns, memory_budget_mb=MEMORY_BUDGET_MB):
+    # Number of rows per chunk so that one parsed chunk stays within the memory budget
+    return max(1000, int(memory_budget_mb * 2**20 // (BYTES_PER_FIELD * max(1, columns))))
+
+
+def is_remote(source):
+    return str(source).startswith(('http://', 'https://'))
+
+
+@contextmanager
+def open_source(source):
+    # Byte stream over the export; HTTP bodies are consumed as they arrive instead of being downloaded whole
+    if is_remote(source):
+        with requests.get(source, stream=True, timeout=HTTP_TIMEOUT) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            yield response.raw
+    else:
+        with open(source, 'rb') as handle:
+            yield handle
+
+
+def iter_chunks(source, columns=None, where=None, memory_budget_mb=MEMORY_BUDGET_MB):
+    # Stream the export in bounded chunks, keeping only `columns` (projection pushdown)
+    # and the rows matching `where` (predicate pushdown) from each chunk
+    wanted = None if columns is None else set(columns) | set(where or {})
+    usecols = None if wanted is None else (lambda column: canonical_name(column) in wanted)
+    rows = chunk_rows(len(wanted) if wanted else len(CATEGORY_COLUMNS) + len(NUMERIC_DTYPES), memory_budget_mb)
+    with open_source(source) as handle:
+        reader = pd.read_csv(handle, delimiter=';', dtype=_parse_dtypes(), usecols=usecols, chunksize=rows)
+        for chunk in reader:
+            chunk = apply_schema(chunk)
+            if where:
+                chunk = chunk[where_mask(chunk, where)]
+            yield chunk
+
+
+def iter_pages(source, rows):
+    # Every page of `rows` rows of the export in one pass, indexed by their row number
+    start = 0
+    with open_source(source) as handle:
+        for page in pd.read_csv(handle, delimiter=';', dtype=_parse_dtypes(), chunksize=rows):
+            page.index = pd.RangeIndex(start, start + len(page))
+            start += len(page)
+            yield apply_schema(page)
+
+
+def download(source, path, validators=None):
+    # Conditional GET of the export into `path`, streamed to disk. Returns the validators (ETag and
+    # Last-Modified) of the new copy, or None when the server answers 304 to those of the previous one.
+    validators = validators or {}
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    with requests.get(source, headers=headers, stream=True, timeout=HTTP_TIMEOUT) as response:
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        response.raw.decode_content = True
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as handle:
+            shutil.copyfileobj(response.raw, handle, 2**20)
+        os.replace(tmp_path, path)
+        return {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+
+
+def snapshot_path(source, cache_dir=CACHE_DIR):
+    key = hashlib.sha1(str(source).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, f'effectifs-{key}.parquet')
+
+
+def write_snapshot(data, path):
+    # Write to a temporary file first so a concurrent reader never sees a partial snapshot
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    data.to_parquet(tmp_path, engine='pyarrow', index=False)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path):
+    return pd.read_parquet(path, engine='pyarrow')
+
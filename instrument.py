@@ -0,0 +1,189 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from settings import LOG_LEVEL, METRICS_FILE, PROFILE
+
+# Per-section instrumentation of a script run: wall time, allocation delta and the bytes of the
+# messages sent to the browser. Sections are delimited by section()/header() calls in the order the
+# script runs; when profiling is off every call is a no-op.
+
+logger = logging.getLogger('portfolio.perf')
+
+# Process-wide totals exported in the Prometheus text format: {section: [runs, seconds, bytes]}
+_totals = {}
+_totals_lock = threading.Lock()
+
+_logging_lock = threading.Lock()
+
+
+def configure_logging(level=LOG_LEVEL):
+    # Give the app's loggers ('portfolio.perf', 'portfolio.refresh') a handler of their own, once per
+    # process: nothing else configures them, and Python would drop their INFO records
+    app_logger = logging.getLogger('portfolio')
+    with _logging_lock:
+        if app_logger.handlers:
+            return
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        app_logger.addHandler(handler)
+        app_logger.setLevel(level)
+        app_logger.propagate = False
+
+
+class _Disabled:
+    records = []
+
+    def section(self, name):
+        pass
+
+    def header(self, title, *args, section=None, **kwargs):
+        st.header(title, *args, **kwargs)
+
+    def finish(self):
+        return self.records
+
+    def restore(self):
+        pass
+
+    def restart(self):
+        return self
+
+
+class Profiler:
+
+    def __init__(self, track_memory=False):
+        self.records = []
+        self.track_memory = track_memory
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._payload = 0
+        self._current = None
+        self._ctx = get_script_run_ctx()
+        self._enqueue = getattr(self._ctx, '_enqueue', None)
+        if self._enqueue is not None:
+            # Count the serialized size of every message this run sends to the browser
+            self._ctx._enqueue = self._counting_enqueue
+
+    def _counting_enqueue(self, msg):
+        self._payload += msg.ByteSize()
+        self._enqueue(msg)
+
+    def _snapshot(self):
+        memory = tracemalloc.get_traced_memory()[0] if self.track_memory else None
+        return time.perf_counter(), memory, self._payload
+
+    def _close(self):
+        if self._current is None:
+            return
+        name, (started, memory, payload) = self._current
+        now, memory_now, payload_now = self._snapshot()
+        self.records.append({
+            'section': name,
+            'seconds': now - started,
+            'alloc_bytes': None if memory is None else memory_now - memory,
+            'payload_bytes': payload_now - payload if self._enqueue is not None else None,
+        })
+        self._current = None
+
+    def section(self, name):
+        # End the running section and start `name`
+        self._close()
+        self._current = (name, self._snapshot())
+
+    def header(self, title, *args, section=None, **kwargs):
+        # st.header that also opens a section named after the header (or `section`, for titles that
+        # change with a widget and would otherwise start a new metric series for every value)
+        self.section(section or title)
+        st.header(title, *args, **kwargs)
+
+    def finish(self):
+        # Restore the message queue, close the last section and publish the records of this run
+        self.restore()
+        self._close()
+        logger.info(json.dumps({'event': 'rerun', 'sections': self.records}))
+        with _totals_lock:
+            for record in self.records:
+                runs = _totals.setdefault(record['section'], [0, 0.0, 0])
+                runs[0] += 1
+                runs[1] += record['seconds']
+                runs[2] += record['payload_bytes'] or 0
+            if METRICS_FILE:
+                write_metrics(METRICS_FILE)
+        return self.records
+
+    def restore(self):
+        # Hand the run its own message queue back; the caller runs this in a finally clause, so that a
+        # run interrupted by a rerun does not leave the counter installed for the next one to wrap again
+        if self._enqueue is not None and self._ctx._enqueue == self._counting_enqueue:
+            self._ctx._enqueue = self._enqueue
+
+    def restart(self):
+        # Fresh profiler with the same settings, for a fragment rerun outside the run that created this one
+        return Profiler(track_memory=self.track_memory)
+
+
+def start_run(enabled=None):
+    # Profiler for one script run; PORTFOLIO_PROFILE=on (or memory, to also track allocations) enables it
+    configure_logging()
+    if enabled is None:
+        enabled = bool(PROFILE)
+    if not enabled:
+        return _Disabled()
+    return Profiler(track_memory=PROFILE == 'memory')
+
+
+def fragment(func):
+    # st.fragment whose own reruns are profiled as runs of their own. `func` takes the profiler
+    # of the current run as first argument: the one of the script run when it runs inline,
+    # a new one when only the fragment reruns (the script-level profiler is finished by then).
+    @st.fragment
+    @functools.wraps(func)
+    def rerunnable(profiler, *args, **kwargs):
+        ctx = get_script_run_ctx()
+        if ctx is None or not ctx.fragment_ids_this_run:
+            return func(profiler, *args, **kwargs)
+        profiler = profiler.restart()
+        try:
+            return func(profiler, *args, **kwargs)
+        finally:
+            profiler.finish()
+    return rerunnable
+
+
+def prometheus_text():
+    lines = [
+        '# HELP portfolio_section_runs_total Script runs that went through the section.',
+        '# TYPE portfolio_section_runs_total counter',
+    ]
+    samples = {'runs_total': [], 'seconds_total': [], 'payload_bytes_total': []}
+    for name, (runs, seconds, payload) in sorted(_totals.items()):
+        label = json.dumps(name, ensure_ascii=False)
+        samples['runs_total'].append(f'portfolio_section_runs_total{{section={label}}} {runs}')
+        samples['seconds_total'].append(f'portfolio_section_seconds_total{{section={label}}} {seconds:.6f}')
+        samples['payload_bytes_total'].append(f'portfolio_section_payload_bytes_total{{section={label}}} {payload}')
+    lines += samples['runs_total']
+    lines += [
+        '# HELP portfolio_section_seconds_total Wall time spent in the section.',
+        '# TYPE portfolio_section_seconds_total counter',
+    ] + samples['seconds_total']
+    lines += [
+        '# HELP portfolio_section_payload_bytes_total Bytes sent to browsers by the section.',
+        '# TYPE portfolio_section_payload_bytes_total counter',
+    ] + samples['payload_bytes_total']
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics(path):
+    # Prometheus text file, e.g. for the node_exporter textfile collector; replaced atomically
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as handle:
+        handle.write(prometheus_text())
+    os.replace(tmp_path, path)
@@ -0,0 +1,167 @@
+import folium
+import numpy as np
+import pandas as pd
+from branca.colormap import StepColormap
+from branca.element import MacroElement
+from branca.utilities import color_brewer
+from folium.template import Template
+
+import rates
+
+# Initial view of the department map
+MAP_CENTER = [46.603354, 1.888334]
+MAP_ZOOM = 6
+
+# Seconds the map waits for department boundaries still being loaded before it is drawn without them
+BOUNDARIES_WAIT_SECONDS = 2
+
+# Number of colour classes of the choropleth, as folium.Choropleth draws it by default
+CHOROPLETH_BINS = 6
+
+# Style of the department polygons; their fill colour is set by the layer of the selected year
+DEPARTMENT_STYLE = {'fillColor': 'black', 'fillOpacity': 0.7, 'color': 'black', 'weight': 1, 'opacity': 0.2}
+
+# Approximate centre of each department, used to place the prevalence markers
+DEPT_COORDINATES = {
+    '01': [46.2500, 5.0000], '02': [49.5000, 3.5000], '03': [46.3333, 3.1667], '04': [44.0833, 6.2333],
+    '05': [44.6667, 6.3333], '06': [43.6667, 7.1500], '07': [44.7500, 4.5833], '08': [49.5000, 4.7500],
+    '09': [42.9167, 1.5833], '10': [48.3333, 4.0833], '11': [43.0833, 2.4167], '12': [44.3333, 2.6667],
+    '13': [43.5167, 5.3833], '14': [49.1667, -0.3500], '15': [45.0333, 2.6667], '16': [45.6667, 0.1667],
+    '17': [45.7500, -0.6333], '18': [47.0833, 2.4167], '19': [45.3667, 1.8667], '2A': [41.8333, 8.7500],
+    '2B': [42.3667, 9.1667], '21': [47.3167, 5.0167], '22': [48.5000, -2.8333], '23': [46.0833, 2.1667],
+    '24': [45.0000, 0.7500], '25': [47.1667, 6.3333], '26': [44.7500, 5.2500], '27': [49.0167, 1.0000],
+    '28': [48.3333, 1.2500], '29': [48.1667, -4.0833], '30': [44.1667, 4.0833], '31': [43.6667, 1.3333],
+    '32': [43.6667, 0.5833], '33': [44.8333, -0.6667], '34': [43.6667, 3.8333], '35': [48.0833, -1.6667],
+    '36': [46.6667, 1.5833], '37': [47.3333, 0.6667], '38': [45.3333, 5.5833], '39': [46.7500, 5.7500],
+    '40': [44.0000, -0.7500], '41': [47.5833, 1.3333], '42': [45.6667, 4.2500], '43': [45.0833, 3.9167],
+    '44': [47.3333, -1.6667], '45': [47.9167, 2.1333], '46': [44.6667, 1.6667], '47': [44.5000, 0.4167],
+    '48': [44.6667, 3.5000], '49': [47.3333, -0.5833], '50': [49.1167, -1.4000], '51': [49.0833, 4.0000],
+    '52': [48.0000, 5.3333], '53': [48.0833, -0.7667], '54': [48.8333, 6.1667], '55': [49.0833, 5.3333],
+    '56': [47.8333, -3.0000], '57': [49.0000, 6.5000], '58': [47.0000, 3.6667], '59': [50.6667, 3.0833],
+    '60': [49.4167, 2.4167], '61': [48.5000, 0.1667], '62': [50.4167, 2.7500], '63': [45.7500, 3.1667],
+    '64': [43.2500, -0.5833], '65': [43.0833, 0.1667], '66': [42.5000, 2.7500], '67': [48.5833, 7.7500],
+    '68': [47.7500, 7.3333], '69': [45.7500, 4.8333], '70': [47.6667, 6.0833], '71': [46.6667, 4.4167],
+    '72': [47.9167, 0.2500], '73': [45.5833, 6.4167], '74': [46.0833, 6.5833], '75': [48.8566, 2.3522],
+    '76': [49.6667, 0.5833], '77': [48.6667, 2.7500], '78': [48.8333, 1.9167], '79': [46.3333, -0.5000],
+    '80': [50.0000, 2.5000], '81': [43.6667, 2.2500], '82': [44.0833, 1.2500], '83': [43.4167, 6.0000],
+    '84': [44.0000, 5.0000], '85': [46.6667, -1.6667], '86': [46.5833, 0.3333], '87': [45.8333, 1.3333],
+    '88': [48.0833, 6.6667], '89': [47.7833, 3.5667], '90': [47.6167, 6.8333], '91': [48.6167, 2.4000],
+    '92': [48.8333, 2.2500], '93': [48.9167, 2.4167], '94': [48.7667, 2.4667], '95': [49.0500, 2.1167],
+    '971': [16.2650, -61.5500], '972': [14.6415, -61.0242], '973': [3.9339, -53.1258], '974': [-21.1151, 55.5364],
+    '976': [-12.8275, 45.1667]
+}
+
+
+def dept_values(cube, where):
+    # Cases (Ntop, the patients of the indicators of `where`), population and prevalence per
+    # department for every year, from the 'tous âges' / 'tous sexes' total rows of the export, with
+    # the marker geometry and size precomputed. Every indicator row carries the whole population of
+    # its department (Npop), so the population is that of one indicator, not their sum.
+    by = ['annee', 'dept']
+    indicators = cube.query(by + ['patho_niv3'], where=where, age='total', sex='total', measures=['Ntop', 'Npop'])
+    values = indicators.groupby(by, observed=True).agg(Ntop=('Ntop', 'sum'), Npop=('Npop', 'max')).reset_index()
+    values['prev'] = rates.rate(values['Ntop'], values['Npop'])
+    values = values[values['dept'] != '999']
+    values['dept'] = values['dept'].astype(str)
+    coords = pd.DataFrame.from_dict(DEPT_COORDINATES, orient='index', columns=['latitude', 'longitude'])
+    values = values.join(coords, on='dept', how='left')
+    prev_max = values.groupby('annee')['prev'].transform('max')
+    values['prev_radius'] = values['prev'] / prev_max * 15
+    return values.reset_index(drop=True)
+
+
+def marker_collection(values):
+    # One GeoJSON FeatureCollection of points for all departments, instead of a CircleMarker per row
+    values = values[values['latitude'].notna() & values['longitude'].notna()]
+    coordinates = values[['longitude', 'latitude']].to_numpy().tolist()
+    properties = pd.DataFrame({
+        'dept': values['dept'],
+        'Ntop': values['Ntop'].astype(float),
+        'Npop': values['Npop'].astype(float),
+        'prev': values['prev'].astype(float).round(3),
+        'radius': np.round(values['prev_radius'].astype(float) * 0.5, 2),
+    }).to_dict('records')
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': point}, 'properties': props}
+            for point, props in zip(coordinates, properties)
+        ],
+    }
+
+
+def cases_colormap(values):
+    # One colour scale for every year, so that switching years keeps colours comparable
+    cases = values['Ntop'].astype(float)
+    vmin, vmax = (cases.min(), cases.max()) if cases.notna().any() else (0.0, 1.0)
+    return StepColormap(
+        color_brewer("YlOrRd", n=CHOROPLETH_BINS),
+        index=np.linspace(vmin, vmax, CHOROPLETH_BINS + 1).tolist(),
+        vmin=vmin,
+        vmax=vmax,
+        caption="Cancer Cases",
+    )
+
+
+def year_data(values, colormap):
+    # What the map shows for one year, as plain JSON data: the fill colour of each department
+    # and the prevalence markers
+    cases = values.set_index('dept')['Ntop'].astype(float).dropna()
+    colors = {dept: colormap(value) for dept, value in cases.items()}
+    return colors, marker_collection(values)
+
+
+class DepartmentColors(MacroElement):
+    # Fills the department polygons of the base map with the colours of one year, looked up by
+    # their 'code' property, once the layer group holding this element is on the map
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function (group, colors) {
+            function fill() {
+                group._map.eachLayer(function (layer) {
+                    var feature = layer.feature;
+                    if (feature && feature.geometry.type !== 'Point' && layer.setStyle) {
+                        layer.setStyle({fillColor: colors[feature.properties.code] || 'black'});
+                    }
+                });
+            }
+            if (group._map) { fill(); } else { group.once('add', fill); }
+        })({{ this._parent.get_name() }}, {{ this.colors|tojson }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, colors):
+        super().__init__()
+        self._name = 'DepartmentColors'
+        self.colors = colors
+
+
+def base_map(geojson, colormap):
+    # Static part of the map: tiles, legend and the department geometry, identical for every year
+    # so the browser keeps it between reruns. A new map is built for every render, as rendering
+    # one (st_folium adds the year layer to it) mutates it.
+    m = folium.Map(location=MAP_CENTER, zoom_start=MAP_ZOOM)
+    colormap.add_to(m)
+    if geojson is not None:
+        folium.GeoJson(geojson, name="departments", style_function=lambda feature: DEPARTMENT_STYLE).add_to(m)
+    return m
+
+
+def year_layer(colors, markers, year):
+    # Data that changes with the selected year: the department colours and the prevalence markers,
+    # without the geometry, which stays in the base map
+    layer = folium.FeatureGroup(name=f"Cancer cases {year}")
+    DepartmentColors(colors).add_to(layer)
+    if not markers['features']:
+        return layer
+    folium.GeoJson(
+        markers,
+        name="prevalence",
+        marker=folium.CircleMarker(color="blue", fill=True, fill_opacity=0.6),
+        style_function=lambda feature: {'radius': feature['properties']['radius']},
+        popup=folium.GeoJsonPopup(
+            fields=['dept', 'Ntop', 'Npop', 'prev'],
+            aliases=['Department:', 'Cancer Cases:', 'Population:', 'Prevalence (%):'],
+        ),
+    ).add_to(layer)
+    return layer
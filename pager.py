@@ -0,0 +1,188 @@
+import abc
+import hashlib
+import io
+import json
+import mmap
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from ingest import iter_chunks, read_csv, where_mask
+from settings import CACHE_DIR
+
+# Paging sources of the data preview. A page is read on its own, in constant time and memory whatever
+# the size of the dataset: from the CSV copy through an index of the byte offset of every row (both
+# memory-mapped), or from the memory-mapped Arrow partitions when there is no single CSV file. Sorting
+# and filtering run server side: one pass over the columns involved gives the row numbers of the
+# result, memory-mapped from the cache directory, and each page then only reads its own rows.
+
+# Columns the preview can be filtered on (one value at a time) and sorted by
+PREVIEW_FILTERS = ['annee', 'patho_niv1', 'patho_niv2', 'patho_niv3', 'region', 'dept', 'libelle_classe_age', 'libelle_sexe']
+PREVIEW_SORTS = PREVIEW_FILTERS + ['Ntop', 'Npop', 'prev']
+
+# Bytes of the CSV scanned at once while indexing it
+INDEX_BLOCK_BYTES = 64 * 2**20
+
+
+def _save(array, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp.npy'
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+def row_offsets(mapped):
+    # Byte offset of the start of every data row of a CSV, plus the end of the last one
+    size = len(mapped)
+    newlines = []
+    for start in range(0, size, INDEX_BLOCK_BYTES):
+        block = np.frombuffer(mapped, dtype=np.uint8, count=min(INDEX_BLOCK_BYTES, size - start), offset=start)
+        newlines.append(np.flatnonzero(block == ord('\n')) + start)
+        del block
+    # Rows start after each newline (the first one ends the header); the last row ends with the file
+    offsets = np.concatenate(newlines + [np.array([size - 1])]).astype(np.int64) + 1
+    if len(offsets) > 1 and offsets[-2] == size:
+        # The file ends with a newline, which starts no row
+        offsets = offsets[:-1]
+    return offsets
+
+
+def _digest(text):
+    return hashlib.sha1(str(text).encode('utf-8')).hexdigest()[:16]
+
+
+class Pager(abc.ABC):
+    # Rows of the dataset by position, sorted and filtered on request. The row numbers of a sort or
+    # filter are computed once per `version` of the data of `source` and kept in the cache directory
+    # as preview/<source>-<version>-<query>.npy; those of older versions are deleted.
+
+    def __init__(self, source, version, cache_dir=CACHE_DIR):
+        self.version = version
+        self._directory = os.path.join(cache_dir, 'preview')
+        self._prefix = f'{_digest(source)}-{_digest(version)}-'
+        self._values = {}
+        self._lock = threading.Lock()
+        if os.path.isdir(self._directory):
+            source_prefix = self._prefix.split('-')[0] + '-'
+            for name in os.listdir(self._directory):
+                if name.startswith(source_prefix) and not name.startswith(self._prefix):
+                    # Readers of an older version keep the files they mapped
+                    os.remove(os.path.join(self._directory, name))
+
+    def _path(self, name):
+        return os.path.join(self._directory, f'{self._prefix}{name}.npy')
+
+    @abc.abstractmethod
+    def __len__(self):
+        # Number of rows of the dataset
+        ...
+
+    @abc.abstractmethod
+    def _columns(self, columns, where=None):
+        # The given columns of the rows matching `where`, indexed by row number
+        ...
+
+    @abc.abstractmethod
+    def _rows(self, positions):
+        # The rows at `positions`, in that order, indexed by row number
+        ...
+
+    def _range(self, start, stop):
+        return self._rows(np.arange(start, stop))
+
+    def order(self, sort=None, descending=False, where=None):
+        # Row numbers of the rows matching `where` sorted on `sort`; None for all rows in file order
+        if sort is None and not where:
+            return None
+        path = self._path(_digest(json.dumps([sort, descending, sorted((where or {}).items())], default=str)))
+        with self._lock:
+            if not os.path.exists(path):
+                columns = self._columns([sort] if sort else list(where)[:1], where)
+                if sort:
+                    # A stable sort keeps the file order of equal values
+                    columns = columns.sort_values(sort, ascending=not descending, kind='stable', na_position='last')
+                _save(columns.index.to_numpy(dtype=np.int64), path)
+        return np.load(path, mmap_mode='r')
+
+    def count(self, where=None):
+        order = self.order(where=where)
+        return len(self) if order is None else len(order)
+
+    def page(self, start, rows, sort=None, descending=False, where=None):
+        order = self.order(sort, descending, where)
+        if order is None:
+            return self._range(start, min(start + rows, len(self)))
+        return self._rows(np.asarray(order[start:start + rows]))
+
+    def values(self, column):
+        # Distinct values of a column, sorted, e.g. to offer them as filters
+        values = self._values.get(column)
+        if values is None:
+            values = self._values[column] = sorted(self._columns([column])[column].dropna().unique())
+        return values
+
+
+class CsvPager(Pager):
+    # Pages read straight from the CSV through the offset of each row
+
+    def __init__(self, path, cache_dir=CACHE_DIR):
+        # The version of a file is its modification time and size
+        stat = os.stat(path)
+        super().__init__(os.path.abspath(path), (stat.st_mtime_ns, stat.st_size), cache_dir)
+        self.path = path
+        with open(path, 'rb') as handle:
+            self._mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        index_path = self._path('rows')
+        if not os.path.exists(index_path):
+            _save(row_offsets(self._mapped), index_path)
+        self._offsets = np.load(index_path, mmap_mode='r')
+        self._header = self._mapped[:self._offsets[0]]
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def _parse(self, lines, positions):
+        body = b''.join(line if line.endswith(b'\n') else line + b'\n' for line in lines)
+        rows = read_csv(io.BytesIO(self._header + body))
+        rows.index = pd.Index(positions)
+        return rows
+
+    def _range(self, start, stop):
+        # One contiguous read for the rows of a page in file order
+        if start >= stop:
+            return self._parse([], [])
+        return self._parse([self._mapped[self._offsets[start]:self._offsets[stop]]], np.arange(start, stop))
+
+    def _rows(self, positions):
+        lines = [self._mapped[self._offsets[p]:self._offsets[p + 1]] for p in positions]
+        return self._parse(lines, positions)
+
+    def _columns(self, columns, where=None):
+        # Chunked pass reading only these columns; the chunks keep the row numbers of the file
+        chunks = list(iter_chunks(self.path, columns=columns, where=where))
+        return pd.concat(chunks)[columns] if chunks else pd.DataFrame(columns=columns)
+
+
+class ArrowPager(Pager):
+    # Pages sliced from the memory-mapped Arrow table of a shared dataset (store.SharedDataset)
+
+    def __init__(self, dataset, source, version, cache_dir=CACHE_DIR):
+        super().__init__(source, version, cache_dir)
+        self.dataset = dataset
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def _range(self, start, stop):
+        return self.dataset.page(start, stop - start)
+
+    def _rows(self, positions):
+        rows = self.dataset.table.take(positions).to_pandas()
+        rows.index = pd.Index(positions)
+        return rows
+
+    def _columns(self, columns, where=None):
+        frame = self.dataset.to_frame(list(dict.fromkeys(columns + list(where or {}))))
+        return frame[where_mask(frame, where)][columns]
@@ -0,0 +1,62 @@
+import numpy as np
+
+from ingest import NUMERIC_DTYPES
+
+# Rates of the cube, derived from its additive measures instead of being summed like them. The
+# prevalence of the export (`prev`, in % of the population) only holds for its own row: the
+# prevalence of a group of rows is 100 * sum(Ntop) / sum(Npop), the mean of the row prevalences
+# weighted by their population. Every roll-up sums the case counts and the population behind them,
+# and the rate of each of its cells is computed from those sums once, vectorised, when it is built.
+
+# `prev` is a percentage
+RATE_SCALE = 100
+
+# Population of the rows whose case count is published: the denominator of the prevalence, so that
+# the rows of the export whose Ntop is withheld (small counts) do not dilute it
+DENOMINATOR = 'Npop_ntop'
+
+# Measures summed by the roll-ups
+ADDITIVE = ['Npop', 'Ntop', DENOMINATOR]
+
+# Rates and the additive measures they are computed from: (numerator, denominator)
+RATES = {'prev': ('Ntop', DENOMINATOR)}
+
+
+def with_denominator(frame):
+    # Raw rows with the population behind their case count (0 where Ntop is missing)
+    if DENOMINATOR in frame.columns or not {'Npop', 'Ntop'} <= set(frame.columns):
+        return frame
+    return frame.assign(**{DENOMINATOR: frame['Npop'].where(frame['Ntop'].notna(), 0)})
+
+
+def summed(measures):
+    # Additive measures to sum for `measures`: themselves, or the inputs of the rates among them
+    columns = []
+    for measure in measures:
+        for column in RATES.get(measure, (measure,)):
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+
+def rate(numerator, denominator, scale=RATE_SCALE):
+    # scale * numerator / denominator element-wise, missing where the denominator is 0 or missing
+    numerator = np.asarray(numerator, dtype='float64')
+    denominator = np.asarray(denominator, dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = scale * numerator / denominator
+    rates[~(denominator > 0)] = np.nan
+    return rates
+
+
+def with_rates(frame):
+    # Summed measures with the rates of every row computed from them, in the dtype of the export
+    computed = {
+        name: rate(
+            frame[numerator].to_numpy(dtype='float64', na_value=np.nan),
+            frame[denominator].to_numpy(dtype='float64', na_value=np.nan),
+        ).astype(NUMERIC_DTYPES.get(name, 'float64'))
+        for name, (numerator, denominator) in RATES.items()
+        if numerator in frame.columns and denominator in frame.columns
+    }
+    return frame.assign(**computed) if computed else frame
@@ -0,0 +1,260 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+import pandas as pd
+
+from cube import DIMENSIONS, LABELS, MEASURES, Cube
+from ingest import download, is_remote, iter_chunks, read_csv, snapshot_path
+from pager import ArrowPager, CsvPager
+from settings import CACHE_DIR, INGEST_MODE, QUERY_ENGINE, REFRESH_INTERVAL
+from store import SharedDataset, partition_dir, partition_path, write_arrow
+
+# Stale-while-revalidate serving of the dataset: requests always get the last good release at once,
+# while a background thread revalidates the export with conditional requests (ETag / Last-Modified)
+# and, when it changed, rebuilds the snapshot and the cube before swapping them in.
+#
+# In snapshot mode the dataset is stored partitioned by year, and a rebuild only reprocesses the years
+# whose rows changed: the other partitions and their roll-ups are kept as they are, and the cube is
+# merged from the per-year cubes (Cube.merge) instead of regrouping the whole history. The source can
+# be one export (parsed again, but only changed years are re-aggregated and rewritten) or a directory
+# of CSV files, e.g. one per year, where only new or modified files are read at all.
+#
+# The cache directory holds:
+# - effectifs-<key>/annee=<year>.arrow, the partitions (snapshot mode);
+# - effectifs-<key>.csv, the last downloaded copy of a remote export from which a release was built;
+# - effectifs-<key>.download.csv, a newer download while its release is being built (it only replaces
+#   the copy once the build succeeded, and is deleted when it fails);
+# - effectifs-<key>.json, its validators, the release version, the time of the last check and, for each
+#   partition, the digest of its rows and the file it came from.
+
+logger = logging.getLogger('portfolio.refresh')
+
+# One built version of the dataset: `data` is the shared snapshot (None in streaming mode, where only
+# the cube is kept, and with the DuckDB engine, whose cube queries the Parquet snapshot on disk) and `path` the local CSV copy it was built from (None when served from the snapshot)
+Release = namedtuple('Release', ['version', 'data', 'cube', 'path'])
+
+
+class Refresher:
+
+    def __init__(self, source, cache_dir=CACHE_DIR, interval=REFRESH_INTERVAL, mode=INGEST_MODE, engine=QUERY_ENGINE):
+        self.source = source
+        self.interval = interval
+        self.mode = mode
+        self.engine = engine
+        base = os.path.splitext(snapshot_path(source, cache_dir))[0]
+        self.snapshot_path = snapshot_path(source, cache_dir)
+        self.partition_dir = partition_dir(source, cache_dir)
+        self.copy_path = f'{base}.csv' if is_remote(source) else source
+        self.download_path = f'{base}.download.csv' if is_remote(source) else None
+        self.meta_path = f'{base}.json'
+        if os.path.isdir(self.copy_path) and (mode != 'snapshot' or engine != 'pandas'):
+            raise ValueError("a directory of CSV files is only supported in snapshot mode with the pandas engine")
+        self.cache_dir = cache_dir
+        # Cube of each year partition, kept between rebuilds
+        self._parts = {}
+        self._pager = None
+        self._pager_lock = threading.Lock()
+        self._release = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path, encoding='utf-8') as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, meta):
+        os.makedirs(os.path.dirname(self.meta_path), exist_ok=True)
+        tmp_path = f'{self.meta_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as handle:
+            json.dump(meta, handle)
+        os.replace(tmp_path, self.meta_path)
+
+    def _has_copy(self):
+        # Something to serve without touching the source: the Parquet snapshot with DuckDB,
+        # the CSV copy in streaming mode, the year partitions otherwise
+        if self.engine == 'duckdb':
+            return os.path.exists(self.snapshot_path)
+        if self.mode == 'stream':
+            return os.path.exists(self.copy_path)
+        partitions = self._read_meta().get('partitions')
+        return bool(partitions) and all(os.path.exists(partition_path(self.partition_dir, year)) for year in partitions)
+
+    def _inputs(self, copy=None):
+        # CSV files making up the local copy: {name: path}; `copy` is a download standing in for the copy
+        if os.path.isdir(self.copy_path):
+            names = sorted(name for name in os.listdir(self.copy_path) if name.endswith('.csv'))
+            return {name: os.path.join(self.copy_path, name) for name in names}
+        return {os.path.basename(self.copy_path): copy or self.copy_path}
+
+    def _fetch(self, validators):
+        # Validators of the source when it changed since `validators`, None otherwise; those of a
+        # directory map each of its CSV files to its own
+        if is_remote(self.source):
+            return download(self.source, self.download_path, validators)
+        current = {}
+        for name, path in self._inputs().items():
+            stat = os.stat(path)
+            current[name] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+        if not os.path.isdir(self.copy_path):
+            current = current[os.path.basename(self.copy_path)]
+        return None if current == validators else current
+
+    def _part(self, year):
+        # Cube of one year, built from its partition the first time this process needs it
+        part = self._parts.get(year)
+        if part is None:
+            part = self._parts[year] = Cube.from_frame(SharedDataset(partition_path(self.partition_dir, year)).to_frame())
+        return part
+
+    def _update_partitions(self, meta, validators, copy=None):
+        # Rewrite the partitions of the years whose rows changed in the local copy (or the download
+        # `copy`); returns the partition table of the meta file, {year: {'digest': ..., 'input': file
+        # name}}, in order of first appearance
+        partitions = dict(meta.get('partitions', {}))
+        previous = meta.get('validators') or {}
+        if os.path.isdir(self.copy_path):
+            changed = [name for name in self._inputs() if previous.get(name) != validators.get(name)]
+        else:
+            changed = list(self._inputs(copy))
+        # Years of a changed (or deleted) file that no file provides any more are dropped below
+        stale = {year for year, partition in partitions.items() if partition['input'] in changed or partition['input'] not in self._inputs()}
+        for name in changed:
+            data = read_csv(self._inputs(copy)[name])
+            for year, rows in data.groupby('annee', sort=False):
+                key = str(year)
+                stale.discard(key)
+                digest = hashlib.sha1(pd.util.hash_pandas_object(rows, index=False).to_numpy().tobytes()).hexdigest()
+                if partitions.get(key, {}).get('digest') != digest:
+                    write_arrow(rows, partition_path(self.partition_dir, key))
+                    self._parts[key] = Cube.from_frame(rows)
+                    logger.info("partition annee=%s of %s rebuilt", key, self.source)
+                partitions[key] = {'digest': digest, 'input': name}
+            del data
+        for key in stale:
+            del partitions[key]
+            self._parts.pop(key, None)
+            os.remove(partition_path(self.partition_dir, key))
+        return partitions
+
+    def _build(self, version, rebuild, partitions=None, copy=None):
+        # Release of the local copy (read from the download `copy` when given, which then becomes the
+        # copy); `rebuild` parses it again into the snapshot first (DuckDB), the year partitions are
+        # those given (just updated) or else those of the meta file
+        copy = copy or self.copy_path
+        if self.engine == 'duckdb':
+            # Imported here: DuckDB is only needed by deployments that select it
+            from duckcube import DuckCube, write_parquet
+            if rebuild or not os.path.exists(self.snapshot_path):
+                write_parquet(copy, self.snapshot_path)
+            path = self.copy_path if os.path.exists(copy) else None
+            return Release(version, None, DuckCube(self.snapshot_path), path)
+        if self.mode == 'stream':
+            cube = Cube.from_chunks(iter_chunks(copy, columns=DIMENSIONS + list(LABELS) + MEASURES))
+            return Release(version, None, cube, self.copy_path)
+        # Replacing a partition leaves the pages mapped by the release being served untouched
+        years = list(partitions if partitions is not None else self._read_meta()['partitions'])
+        data = SharedDataset([partition_path(self.partition_dir, year) for year in years])
+        path = self.copy_path if os.path.isfile(copy) else None
+        return Release(version, data, Cube.merge([self._part(year) for year in years]), path)
+
+    def _revalidate(self):
+        # New release when the source changed (always fetched when there is no local copy), None otherwise
+        meta = self._read_meta() if self._has_copy() else {}
+        validators = self._fetch(meta.get('validators'))
+        checked_at = time.time()
+        if validators is None:
+            self._write_meta({**meta, 'checked_at': checked_at})
+            return None
+        version = time.time_ns()
+        # A download only replaces the local copy once a release was built from it: an export that
+        # cannot be built is never served, paged, or taken for the last good copy after a restart
+        copy = self.download_path or self.copy_path
+        try:
+            partitions = None
+            if self.engine == 'pandas' and self.mode == 'snapshot':
+                partitions = self._update_partitions(meta, validators, copy)
+            release = self._build(version, rebuild=True, partitions=partitions, copy=copy)
+        except BaseException:
+            if copy != self.copy_path and os.path.exists(copy):
+                os.remove(copy)
+            raise
+        if copy != self.copy_path:
+            os.replace(copy, self.copy_path)
+        self._write_meta({'validators': validators, 'version': version, 'checked_at': checked_at, 'partitions': partitions})
+        logger.info("dataset %s refreshed, version %s", self.source, version)
+        return release
+
+    def current(self):
+        # Release to serve now: only the very first call of a process without any local copy waits for the source
+        release = self._release
+        if release is None:
+            with self._lock:
+                if self._release is None:
+                    if self._has_copy():
+                        self._release = self._build(self._read_meta().get('version', 0), rebuild=False)
+                    else:
+                        self._release = self._revalidate()
+                release = self._release
+        return release
+
+    def pager(self):
+        # Paging source of the preview. It reads the CSV copy when there is one, so the preview does not
+        # wait for the release to be built; a directory source is paged from the partitions of the release.
+        # Sessions opening the preview at once share one pager instead of each indexing the file
+        if os.path.isfile(self.copy_path):
+            with self._pager_lock:
+                stat = os.stat(self.copy_path)
+                pager = self._pager
+                if not isinstance(pager, CsvPager) or pager.version != (stat.st_mtime_ns, stat.st_size):
+                    pager = self._pager = CsvPager(self.copy_path, self.cache_dir)
+                return pager
+        release = self.current()
+        with self._pager_lock:
+            pager = self._pager
+            if pager is None or pager.version != release.version:
+                pager = self._pager = ArrowPager(release.data, self.source, release.version, self.cache_dir)
+            return pager
+
+    def refresh(self):
+        # Revalidate the source and swap the rebuilt release in; True when it changed
+        with self._lock:
+            release = self._revalidate()
+            if release is not None:
+                self._release = release
+        return release is not None
+
+    def _run(self):
+        while True:
+            due = self._read_meta().get('checked_at', 0) + self.interval
+            if self._stop.wait(max(0.0, due - time.time())):
+                return
+            try:
+                self.refresh()
+            except Exception:
+                # Whatever went wrong (network, disk, an export that no longer parses or aggregates),
+                # keep serving the last good release and try again after a full interval
+                logger.exception("refreshing %s failed", self.source)
+                if self._stop.wait(self.interval):
+                    return
+
+    def start(self):
+        # Revalidate in a daemon thread every `interval` seconds (never when the interval is 0)
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='dataset-refresh', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
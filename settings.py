@@ -0,0 +1,47 @@
+import os
+
+# Runtime configuration for the portfolio app, overridable through environment variables
+
+# Source of the ameli "effectifs" export (a URL or a local CSV such as the bundled effectifs.csv)
+DATA_URL = os.environ.get(
+    'PORTFOLIO_DATA_URL',
+    'https://data.ameli.fr/api/explore/v2.1/catalog/datasets/effectifs/exports/csv?use_labels=true',
+)
+
+# Directory holding the columnar snapshots written after the first download
+CACHE_DIR = os.environ.get('PORTFOLIO_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+
+# How the dataset is ingested: 'snapshot' loads the full typed frame (served from Arrow files, one per year),
+# 'stream' folds the export chunk by chunk into the summary tables without ever holding the raw rows
+INGEST_MODE = os.environ.get('PORTFOLIO_INGEST_MODE', 'snapshot')
+
+# Engine answering the chart queries: 'pandas' (in-memory cube, the default) or 'duckdb' (SQL over the
+# Parquet snapshot, which DuckDB writes from the CSV itself: the dataset no longer has to fit in memory)
+QUERY_ENGINE = os.environ.get('PORTFOLIO_QUERY_ENGINE', 'pandas')
+
+# Upper bound, in megabytes, for one parsed chunk in streaming mode
+MEMORY_BUDGET_MB = int(os.environ.get('PORTFOLIO_MEMORY_BUDGET_MB', '256'))
+
+# Seconds between two background revalidations of the export (conditional requests, 0 disables them)
+REFRESH_INTERVAL = float(os.environ.get('PORTFOLIO_REFRESH_INTERVAL', str(24 * 3600)))
+
+# Timeout, in seconds, for HTTP requests to the data providers
+HTTP_TIMEOUT = float(os.environ.get('PORTFOLIO_HTTP_TIMEOUT', '60'))
+
+# Departments GeoJSON: optional full-resolution copy, read before the on-disk cache and the network
+# (the simplified variant the map uses can also be bundled next to this file, see geo.py)
+GEOJSON_URL = os.environ.get('PORTFOLIO_GEOJSON_URL', 'https://france-geojson.gregoiredavid.fr/repo/departements.geojson')
+GEOJSON_PATH = os.environ.get('PORTFOLIO_GEOJSON_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'departements.geojson'))
+
+# Seconds during which a failed download of the departments is not attempted again
+GEOJSON_RETRY_SECONDS = float(os.environ.get('PORTFOLIO_GEOJSON_RETRY_SECONDS', '600'))
+
+# Per-section profiling of each script run: '' (off), 'on' (wall time and payload) or 'memory' (also allocations)
+PROFILE = os.environ.get('PORTFOLIO_PROFILE', '')
+
+# Level of the app's log records ('portfolio.perf' per-run measures, 'portfolio.refresh' dataset updates),
+# written to stderr next to the server's own log
+LOG_LEVEL = os.environ.get('PORTFOLIO_LOG_LEVEL', 'INFO')
+
+# Optional Prometheus text file refreshed after every profiled run
+METRICS_FILE = os.environ.get('PORTFOLIO_METRICS_FILE', '')
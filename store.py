@@ -0,0 +1,72 @@
+import os
+
+import pandas as pd
+import pyarrow as pa
+
+from ingest import snapshot_path
+from settings import CACHE_DIR
+
+# Immutability contract of the shared store
+#
+# Everything handed out by this module (and cached with st.cache_resource in portfolio.py) is a
+# single object shared by every session of the server process, and the Arrow table is backed by
+# a memory-mapped file shared by every process that opens it. These objects are read-only:
+# - the Arrow table is immutable by construction and its buffers live in the page cache, not in
+#   the heap of a session;
+# - pandas frames derived from it are copy-on-write, so a view that gets modified receives its
+#   own copy and the shared data never changes;
+# - the departements GeoJSON cached by portfolio.py must not be modified in place: build new objects.
+# Code that needs a mutable frame must call .copy() on what it receives.
+
+if int(pd.__version__.split('.')[0]) < 3:
+    # Copy-on-write is always on from pandas 3; earlier versions have to opt in
+    pd.set_option('mode.copy_on_write', True)
+
+
+def write_arrow(data, path):
+    # Uncompressed Arrow IPC file, so that readers can map its buffers instead of decoding them
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def partition_dir(source, cache_dir=CACHE_DIR):
+    # Directory of the year partitions of the dataset, one Arrow file per 'annee'
+    return os.path.splitext(snapshot_path(source, cache_dir))[0]
+
+
+def partition_path(directory, year):
+    return os.path.join(directory, f'annee={year}.arrow')
+
+
+class SharedDataset:
+    # Read-only dataset memory-mapped from an Arrow IPC file, or from several (e.g. one per year)
+    # read as one table without copying; sessions and processes share their pages
+
+    def __init__(self, path):
+        self.path = path
+        paths = [path] if isinstance(path, str) else list(path)
+        tables = [pa.ipc.open_file(pa.memory_map(p, 'r')).read_all() for p in paths]
+        if len(tables) == 1:
+            self.table = tables[0]
+        else:
+            # Partitions may store a label with differently sized dictionary indices: widen them to match
+            self.table = pa.concat_tables(tables, promote_options='permissive')
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def to_frame(self, columns=None):
+        # Materialise (part of) the table as pandas, e.g. to build the cube; the caller owns the result
+        table = self.table if columns is None else self.table.select(columns)
+        return table.to_pandas(split_blocks=True)
+
+    def page(self, start, rows):
+        # Convert only the requested rows; slicing the mapped table copies nothing
+        page = self.table.slice(start, rows).to_pandas()
+        page.index = pd.RangeIndex(start, start + len(page))
+        return page
+